@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Benchmarks for the hot paths of kid_control, against the in-memory fake router.
+
+Runs against a throw-away copy of src/ seeded with a realistically sized document
+(a year of task_status), so the live data.json is never touched. Prints one JSON
+document with the results; --compare fails if a benchmark got slower than a baseline.
+
+    uv run benchmarks/run_benchmarks.py --output baseline.json
+    uv run benchmarks/run_benchmarks.py --compare baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import date, timedelta
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+def seed_document(work_dir, days=365):
+    """Write a data.json with a year of completed tasks, like a long-running install."""
+    rng = random.Random(42)
+    today = date.today()
+    tasks = ('homework', 'coding', 'washes', 'english', 'outdoor')
+    task_status = {}
+    for offset in range(1, days + 1):
+        day = (today - timedelta(days=offset)).isoformat()
+        task_status[day] = {task: True for task in tasks if rng.random() < 0.5}
+    data = {
+        'time_records': {'elapsed_time': '0', 'rest_time': '0'},
+        'network_status': 'disabled',
+        'devices': {},
+        'current_day': today.isoformat(),
+        'task_status': task_status,
+        'settings': {'period': 75, 'restime': 80, 'starting': '0:00', 'ending': '23:59',
+                     'mon': 600, 'tue': 600, 'wed': 600, 'thu': 600, 'fri': 600, 'sat': 600, 'sun': 600,
+                     'current': 0},
+    }
+    with open(os.path.join(work_dir, 'data.json'), 'w') as f:
+        json.dump(data, f, indent=4)
+    return os.path.getsize(os.path.join(work_dir, 'data.json'))
+
+def measure(fn, iterations, warmup=5):
+    """Call fn() iterations times and return latency percentiles and throughput."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+    return summarize(samples, total)
+
+def summarize(samples, total):
+    samples = sorted(samples)
+    return {
+        'iterations': len(samples),
+        'total_s': round(total, 4),
+        'ops_per_s': round(len(samples) / total, 1) if total else None,
+        'p50_ms': round(statistics.median(samples) * 1000, 4),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1] * 1000, 4),
+        'max_ms': round(samples[-1] * 1000, 4),
+    }
+
+def run(args):
+    temp_dir = tempfile.mkdtemp(prefix='kidcontrol-bench-')
+    # copytree needs a destination that doesn't exist yet
+    work_dir = os.path.join(temp_dir, 'src')
+    try:
+        shutil.copytree(SRC_DIR, work_dir,
+                        ignore=shutil.ignore_patterns('data.json', 'data.db*', 'history.db', 'usage_events*',
+                                                      '__pycache__', 'coding_links.json'))
+        size = seed_document(work_dir, args.days)
+        # Never the real router: the benchmarks toggle the restrict rules hundreds of times
+        os.environ['KIDCONTROL_ROUTER_BACKEND'] = 'fake'
+        sys.path.insert(0, work_dir)
+        # Syslog may not exist on the benchmark box
+        logging.raiseExceptions = False
+
+        from config import Config
+        from fake_router import FakeRouter, get_fake_router
+        config = Config()
+        if config.config['router_backend'] != 'fake':
+            raise SystemExit(f"Refusing to benchmark: router backend is {config.config['router_backend']!r}, "
+                             f"not the fake router")
+        # Created before the app so RouterControl picks up this instance
+        router = get_fake_router(config.config['openwrt_ip'], hosts=args.hosts, tags=(config.profile_tag(),),
+                                 latency=args.router_latency, jitter=args.router_jitter,
+                                 failure_rate=args.failure_rate, reassociate_after=0, seed=42)
+        import app as appmod
+        # Background work is not started: the benchmarks drive the checks themselves
+        t0 = time.perf_counter()
+        appmod.create_app(start_background=False)
+        startup = time.perf_counter() - t0
+        services = appmod.services
+        if not isinstance(services.router_control.ssh, FakeRouter):
+            raise SystemExit("Refusing to benchmark: the app isn't using the fake router")
+        for control in services.time_controls.values():
+            control.check_network_stability = lambda: True
+
+        from policy import evaluate
+        from time_control import time_checking_all
+
+        n = args.iterations
+        results = {}
+
+        results['config_get'] = measure(lambda: config.get_config_value('current'), n * 10)
+        counter = iter(range(10 ** 9))
+        results['config_set'] = measure(lambda: config.set_config_value('period', 75 + next(counter) % 2), n)
+        results['config_record_event'] = measure(lambda: config.record_event('adjust', minutes=0), n)
+        state = config.snapshot()
+        now = time.time()
+        results['policy_evaluate'] = measure(lambda: evaluate(state, now), n * 10)
+        results['time_checking_tick'] = measure(lambda: time_checking_all(list(services.time_controls.values())), n)
+
+        client = appmod.app.test_client()
+        results['request_index'] = measure(lambda: client.get('/'), n)
+        results['request_api_status'] = measure(lambda: client.get('/api/status'), n)
+
+        def start_stop():
+            client.post('/startcount')
+            client.post('/stopcount')
+        start_stop_result = measure(start_stop, max(1, n // 2))
+        # Two requests per iteration
+        results['request_startcount_stopcount'] = dict(start_stop_result, requests=start_stop_result['iterations'] * 2)
+
+        results['concurrent_requests'] = concurrent_throughput(appmod.app, args.clients, args.requests_per_client)
+
+        control = services.router_control
+        results['router_status_refresh'] = measure(control.refresh_firewall_status, max(1, n // 4))
+        flip = iter(range(10 ** 9))
+        results['router_toggle'] = measure(lambda: control.update_rule_status(next(flip) % 2 == 0), max(2, n // 4))
+        results['router_reconnect'] = measure(lambda: control.reconnect_all_devices().result(), max(1, n // 20), warmup=1)
+        results['router_counters'] = router.latency_stats()
+
+        return {
+            'meta': {
+                'timestamp': int(time.time()),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'storage': config.config['storage'],
+                'document_bytes': size,
+                'task_days': args.days,
+                'router_hosts': args.hosts,
+                'router_latency_s': args.router_latency,
+                'router_jitter_s': args.router_jitter,
+                'router_failure_rate': args.failure_rate,
+                'iterations': n,
+                'startup_s': round(startup, 4),
+            },
+            'results': results,
+        }
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def concurrent_throughput(app, clients, per_client):
+    """Serve the app with the threaded werkzeug server and hammer / and /api/status from many threads."""
+    from werkzeug.serving import make_server
+
+    # One access log line per request would dominate the measurement
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    samples = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index):
+        paths = ('/', '/api/status')
+        local = []
+        for i in range(per_client):
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base + paths[(index + i) % 2], timeout=30) as response:
+                    response.read()
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            local.append(time.perf_counter() - t0)
+        with lock:
+            samples.extend(local)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - start
+    server.shutdown()
+    result = summarize(samples, total) if samples else {'iterations': 0}
+    result.update(clients=clients, errors=len(errors))
+    return result
+
+def compare(current, baseline, tolerance):
+    """Return the benchmarks whose p50 latency grew by more than tolerance over the baseline."""
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before or not before.get('p50_ms') or 'p50_ms' not in result:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms']
+        if ratio > 1 + tolerance:
+            regressions.append({'benchmark': name, 'baseline_p50_ms': before['p50_ms'],
+                                'p50_ms': result['p50_ms'], 'ratio': round(ratio, 2)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200, help='base iteration count per benchmark')
+    parser.add_argument('--days', type=int, default=365, help='days of task_status in the seeded document')
+    parser.add_argument('--hosts', type=int, default=200, help='hosts in the fake router\'s DHCP table')
+    parser.add_argument('--router-latency', type=float, default=0.0, help='seconds added to every fake router command')
+    parser.add_argument('--router-jitter', type=float, default=0.0, help='up to this many extra seconds per command')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of fake router commands that fail')
+    parser.add_argument('--clients', type=int, default=8, help='threads in the concurrent benchmark')
+    parser.add_argument('--requests-per-client', type=int, default=50)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--compare', help='baseline JSON report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p50 slowdown versus the baseline')
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.compare:
+        with open(args.compare) as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    return 1 if report.get('regressions') else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,16 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, make_response, session, send_from_directory
+from flask import Flask, Response, g, render_template, request, redirect, url_for, flash, make_response, session
 import os
 import calendar
 import time
 import json
-import sys
-from datetime import date, datetime, timedelta
-import threading
+import hashlib
+import queue
+from datetime import date, datetime
 
-from config import Config, setup_logger
-from time_control import TimeControl
-from router_control import RouterControl
+from config import setup_logger
+from policy import UsageState, evaluate
+from services import Services
+from metrics import REGISTRY, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, SSE_CLIENTS
 
 # Get logger
 logger = setup_logger('KID.CONTROL')
@@ -17,20 +18,70 @@ logger = setup_logger('KID.CONTROL')
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'  # Replace with your actual secret key
 
-# Initialize our Python classes
-config = Config()
-time_control = TimeControl()
-router_control = RouterControl()
+# Shared objects, created on first use; nothing runs until create_app() or the first request
+services = Services(lambda profile: build_status(services.time_controls[profile])[0])
+
+# Content hash of each static file, recomputed when its mtime changes
+_static_fingerprints = {}
+
+def static_fingerprint(filename):
+    path = os.path.join(app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _static_fingerprints.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, hashlib.sha1(f.read()).hexdigest()[:12])
+        _static_fingerprints[filename] = cached
+    return cached[1]
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    # url_for('static', ...) gets ?v=<content hash>, so the file can be cached until it changes
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        fingerprint = static_fingerprint(values['filename'])
+        if fingerprint:
+            values['v'] = fingerprint
+
+@app.before_request
+def start_timer():
+    g.request_start = time.monotonic()
 
-# Add after_request handler to prevent caching
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or 'unknown'
+    HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    if 'request_start' in g:
+        HTTP_REQUEST_SECONDS.observe(time.monotonic() - g.request_start, endpoint=endpoint)
+    return response
+
+# Add after_request handler to prevent caching of pages; fingerprinted static files are cached for a year
 @app.after_request
 def add_header(response):
+    if request.endpoint == 'static':
+        if request.args.get('v'):
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+    if request.endpoint == 'api_status':
+        # Clients keep the body and revalidate it with If-None-Match
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
     return response
 
-def read_kidcontrol_config():
+def current_time_control():
+    """Return the TimeControl of the profile picked with ?profile=, remembered in the session."""
+    time_controls = services.time_controls
+    profile = request.args.get('profile')
+    if profile in time_controls:
+        session['profile'] = profile
+    return time_controls.get(session.get('profile'), services.time_control)
+
+def read_kidcontrol_config(config):
     hours = {}
     for key in ['period', 'restime', 'starting', 'ending', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun', 'current']:
         value = config.get_config_value(key)
@@ -42,115 +93,53 @@ def read_kidcontrol_config():
                 hours[key] = int(value)
     return hours
 
-def check_firewall_status():
-    router_control.check_firewall_status()  # This will update the status in the JSON file
-    return config.get_network_status()
+def check_firewall_status(control):
+    # Served from the router status cache; falls back to the last status saved in the JSON file
+    return control.router.check_firewall_status() or control.config.get_network_status()
 
-def get_devices():
-    if router_control.get_devices_under_max():
-        devices = config.get_devices()
-        return [device.split('|') for device in devices if device.strip()]
-    return []
-
-def get_time(requested_key):
-    return int(config.get_time_record(requested_key) or '0')
-
-def get_elapsed_time():
-    start_time = get_time('start_time')
-    if start_time == 0:
-        start_time = get_time('stop_time')  # If start_time is not set, use current time
-    
-    current_time = int(time.time())
-    elapsed_time = (current_time - start_time) // 60  # Convert seconds to minutes
-    return elapsed_time
-
-def get_saved_elapsed_time():
-    return get_time('elapsed_time')
-
-def get_saved_rest_time():
-    return get_time('rest_time')
+def build_status(control):
+    """Return the dashboard view model, the state and the decision, from one read and one evaluation."""
+    today = str(date.today())
+    network_status = check_firewall_status(control)
+
+    # One read of the document, one policy evaluation
+    data = control.config.get_profile_data()
+    state = UsageState.from_document(data)
+    decision = evaluate(state, time.time())
+
+    # Map abbreviated weekday names to full names
+    full_weekday_names = {day[:3].lower(): day for day in calendar.day_name}
+    hours = {full_weekday_names.get(day, day): minutes for day, minutes in state.quotas.items()}
+
+    view = {
+        'hours': hours,
+        'total_minutes_used': decision.used_minutes,
+        'network_status': network_status,
+        'elapsed_time': decision.elapsed_minutes,
+        'remaining_time': decision.remaining_minutes,
+        'task_status': data.get('task_status', {}).get(today, {}),
+        'current_day': date.today().strftime('%A').lower(),
+        'needed_rest_time': decision.time_to_start if network_status == 'disabled' else 0, ## after start button
+        'next_rest_time': decision.time_to_stop if network_status != 'disabled' else 0, ## after stop button
+        'profile': control.profile,
+        'profiles': list(services.time_controls),
+        # From the in-memory inventory; only the fields saved in the document, so the ETag covers them
+        'devices': [{'name': device['name'], 'mac': device['mac'], 'online': bool(device.get('online'))}
+                    for device in control.router.get_devices_under_max()],
+    }
+    return view, state, decision
 
 @app.route('/')
 def index():
     try:
-        today = str(date.today())
-        current_day = date.today().strftime('%A').lower()
-        network_status = check_firewall_status()
-        
-        # Get task status for today
-        task_status = config.get_data('task_status')
-        today_status = task_status.get(today, {})
-
-        hours = read_kidcontrol_config()
-        if not hours:
-            logger.error("KID.CONTROL [INDEX] Failed to read kidcontrol config")
-            flash("Error: Could not read configuration")
-            return redirect(url_for('index'))
-
-        # Set default values for all template variables
-        template_vars = {
-            'hours': {},
-            'total_minutes_used': 0,
-            'network_status': 'unknown',
-            'elapsed_time': 0,
-            'remaining_time': 0,
-            'task_status': {},
-            'current_day': current_day,
-            'needed_rest_time': 0,
-            'next_rest_time': 0
-        }
-
-        # Update with actual values
-        saved_minutes_used = hours.pop('current', 0)
-        defined_period = hours.pop('period', 0)
-        defined_restime = hours.pop('restime', 0)
-        hours.pop('starting', 0)
-        hours.pop('ending', 0)
-
-        # Get the maximum minutes allowed for today
-        max_minutes = hours.get(time.strftime('%a').lower(), 0)
-        
-        unsaved_elapsed_time = get_elapsed_time()
-        remaining_time = max_minutes - saved_minutes_used
-       
-        # Map abbreviated weekday names to full names
-        full_weekday_names = {day[:3].lower(): day for day in calendar.day_name}
-        hours = {full_weekday_names.get(day, day): minutes for day, minutes in hours.items()}
-        
-        saved_used_time = get_saved_elapsed_time()
-        saved_rest_time = get_saved_rest_time()
-
-        # Calculate the needed rest time
-        # Usually stop when time is up, so the start time should be based on how many time we have rested
-        # the rest time is two data: saved elsapsed time and unsaved elapsed time
-        # when user is in resting, the start to start to meaningful
-        time_to_start = 0
-        time_to_stop = 0
-
-        if network_status == 'disabled':
-            stop_times = int(saved_used_time / defined_period) if defined_period > 0 else 0
-            required_rest_time = int(stop_times * defined_restime * defined_period / 100) if defined_period > 0 else 0
-            this_time_required_rest_time = required_rest_time - saved_rest_time
-            time_to_start = this_time_required_rest_time - unsaved_elapsed_time
-            logger.info(f"Time.Start: {time_to_start} mins, S.Used({saved_used_time})/S.Rest({saved_rest_time}) => Need.Rest({this_time_required_rest_time}) - U.Rest({unsaved_elapsed_time})")
+        control = current_time_control()
+        template_vars, state, decision = build_status(control)
+
+        if template_vars['network_status'] == 'disabled':
+            logger.info(f"Time.Start: {decision.time_to_start} mins, S.Used({state.elapsed_time})/S.Rest({state.rest_time}) - U.Rest({decision.elapsed_minutes})")
         else:
-            required_rest_time = int(defined_restime * defined_period / 100) if defined_period > 0 else 0
-            time_to_rest = required_rest_time - unsaved_elapsed_time
-            time_to_stop = min(remaining_time, time_to_rest)
-            logger.info(f"Time.Stop: Remaining {remaining_time} or Need.Rest: {time_to_rest}, R({required_rest_time}) - U.Used({unsaved_elapsed_time})")
-
-        # Update template variables
-        template_vars.update({
-            'hours': hours,
-            'total_minutes_used': saved_minutes_used,
-            'network_status': network_status,
-            'elapsed_time': unsaved_elapsed_time,
-            'remaining_time': remaining_time,
-            'task_status': today_status,
-            'needed_rest_time': time_to_start, ## after start button
-            'next_rest_time': time_to_stop ## after stop button
-        })
-        
+            logger.info(f"Time.Stop: {decision.time_to_stop} mins, Remaining {decision.remaining_minutes}, R({state.rest_per_period}) - U.Used({decision.elapsed_minutes})")
+
         try:
             return render_template('index.html', **template_vars)
         except Exception as template_error:
@@ -162,13 +151,70 @@ def index():
         flash("An error occurred while loading the page")
         return redirect(url_for('index'))
 
+def status_etag(control):
+    """ETag of the view build_status() would return, from what it depends on instead of the view itself.
+
+    That is the saved document version (the same in every worker), the router status, the
+    day and the minute the countdowns are at; all of them are cached, so a poll that
+    matches is answered without building the view.
+    """
+    state = UsageState.from_document(control.config.get_profile_data())
+    since = state.start_time or state.stop_time
+    key = (control.config.version(), check_firewall_status(control), control.profile,
+           str(date.today()), int(time.time() - since) // 60)
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+@app.route('/api/status')
+def api_status():
+    """The dashboard view model as JSON, with an ETag of its state for conditional polling."""
+    control = current_time_control()
+    etag = status_etag(control)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    view, _, _ = build_status(control)
+    response = make_response(json.dumps(view, sort_keys=True))
+    response.mimetype = 'application/json'
+    response.set_etag(etag)
+    return response
+
+@app.route('/events')
+def events():
+    """Server-sent events: state transitions and a countdown tick for the selected profile."""
+    publisher = services.publisher
+    client = publisher.subscribe(current_time_control().profile)
+    heartbeat = services.config.config.get('sse_heartbeat', 25)
+
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    yield client.get(timeout=heartbeat)
+                except queue.Empty:
+                    # Keeps proxies and the browser from dropping an idle stream
+                    yield ': keepalive\n\n'
+        finally:
+            publisher.unsubscribe(client)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics():
+    """Counters and histograms in the Prometheus text format."""
+    SSE_CLIENTS.set(services.publisher.client_count())
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/adjust_time', methods=['POST'])
 def adjust_time():
     task = request.form.get('task')
     today = str(date.today())
 
+    control = current_time_control()
+
     # Get task status
-    task_status = config.get_data('task_status')
+    task_status = control.config.get_data('task_status')
 
     # Check if the task has already been completed today
     if task_status.get(today, {}).get(task):
@@ -176,9 +222,6 @@ def adjust_time():
         return redirect(url_for('index'))
 
 
-    # Mark the task as completed for today
-    if today not in task_status:
-        task_status[today] = {}
     if task == "coding":
         coding_link = request.form.get("coding_link", "").strip()
         if coding_link:
@@ -195,13 +238,6 @@ def adjust_time():
             coding_links[today] = coding_link
             with open(coding_links_path, "w", encoding="utf-8") as f:
                 json.dump(coding_links, f, ensure_ascii=False, indent=2)
-        task_status[today][task] = True
-    else:
-        task_status[today][task] = True
-
-    # Save the updated task status
-    config.data['task_status'] = task_status
-    config._save_data()
 
     # Adjust time based on task
     time_adjustments = {
@@ -213,39 +249,47 @@ def adjust_time():
         'outdoor': -60
     }
 
+    # Mark the task as completed for today and adjust the time in one journal event
+    minutes = time_adjustments.get(task, 0)
+    control.config.record_event('adjust', task=task, minutes=minutes, day=today)
     if task in time_adjustments:
-        minutes = time_adjustments[task]
-        config.update_current_usage(minutes)
+        logger.info(f"+++ [NEW TIME]: {task} ({minutes} mins) +++")
         flash(f"{abs(minutes)} minutes charged for finishing {task}.")
+    services.wake('time adjusted')
 
     return redirect(url_for('index'))
 
 @app.route('/startcount', methods=['POST'])
 def startcount():
-    success, message = time_control.start_counting()
+    success, message = current_time_control().start_counting()
+    services.wake('start')
     if not success and message:  # Only flash if there's a message
         flash(message)
     return redirect(url_for('index'))
 
 @app.route('/stopcount', methods=['POST'])
 def stopcount():
-    success, message = time_control.stop_counting()
+    success, message = current_time_control().stop_counting()
+    services.wake('stop')
     if not success and message:  # Only flash if there's a message
         flash(message)
     return redirect(url_for('index'))
 
 @app.route('/edit', methods=['GET', 'POST'])
 def edit_hours():
+    control = current_time_control()
     if request.method == 'POST':
         # Save hours configuration
         hours = {key: value for key, value in request.form.items() if key != 'devices'}
-        for day, minutes in hours.items():
-            config.set_config_value(day, minutes)
+        with control.config.transaction():
+            for day, minutes in hours.items():
+                control.config.set_config_value(day, minutes)
+        services.wake('settings changed')
 
         return redirect(url_for('edit_hours'))
     
-    hours = read_kidcontrol_config()
-    return render_template('edit.html', hours=hours)
+    hours = read_kidcontrol_config(control.config)
+    return render_template('edit.html', hours=hours, profile=control.profile)
 
 @app.route('/validate_password', methods=['POST'])
 def validate_password():
@@ -264,16 +308,23 @@ def check_password_status():
             return "valid"
     return "invalid"
 
-def periodic_time_check():
-    while True:
-        try:
-            time_control.time_checking()
-        except Exception as e:
-            logger.error(f"Error in periodic time_checking: {str(e)}")
-        time.sleep(60)
+def create_app(start_background=True, warm_up=True):
+    """Return the app ready to serve: warmed up, with enforcement started unless asked not to.
+
+    Importing this module has no side effects; tests and tools can use `app` as is and
+    only pay for what they touch. The leader lease is taken before warming up, so only
+    the leader among several workers reads the router.
+    """
+    if start_background:
+        services.start_background()
+    if warm_up:
+        services.warm_up()
+    return app
 
-# Start the periodic thread when the app starts
-threading.Thread(target=periodic_time_check, daemon=True).start()
+def shutdown():
+    """Stop the background work and hand the leader lease to another worker."""
+    services.shutdown()
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0')
+    # The reloader would import the app twice and run enforcement in both processes
+    create_app().run(debug=True, host='0.0.0.0', use_reloader=False)
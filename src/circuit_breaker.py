@@ -0,0 +1,64 @@
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class RouterUnavailable(Exception):
+    """Raised instead of running a router command while the circuit is open."""
+
+class CircuitBreaker:
+    """Fails fast while the router is down.
+
+    After failure_threshold connection failures in a row the circuit opens and allow()
+    refuses every call for reset_timeout seconds. Then one trial call is let through
+    (half open): success closes the circuit, failure opens it for another reset_timeout.
+    """
+    def __init__(self, failure_threshold=3, reset_timeout=30, on_change=None):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.rejected = 0
+
+    def allow(self):
+        """Return whether a call may go to the router now."""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.trial_running = False
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def _set_state(self, state):
+        previous, self.state = self.state, state
+        if self.on_change is not None:
+            self.on_change(previous, state)
+
+    def stats(self):
+        with self.lock:
+            return {'state': self.state, 'failures': self.failures, 'rejected': self.rejected}
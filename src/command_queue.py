@@ -0,0 +1,81 @@
+import collections
+import threading
+from concurrent.futures import Future
+from config import setup_logger
+
+# Get logger
+logger = setup_logger('ROUTER.CONTROL')
+
+class CommandQueue:
+    """Runs router operations one at a time, in order, on a single worker thread.
+
+    Jobs are submitted under a key. While a job is still queued, another submit with the
+    same key is folded into it: merge(queued_payload, new_payload) gives the payload that
+    will run, and every caller gets a Future. resolve(result, merged_payload, own_payload)
+    turns the shared result into each caller's answer, so a caller whose request was
+    superseded by a later one can tell. A submit from the worker thread itself runs inline.
+    """
+    def __init__(self, name='router'):
+        self.name = name
+        self.condition = threading.Condition()
+        self.jobs = collections.deque()
+        self.pending = {}
+        self.thread = None
+        self.stats = {'submitted': 0, 'coalesced': 0, 'executed': 0, 'failed': 0}
+
+    def submit(self, key, fn, payload=None, merge=None, resolve=None):
+        """Queue fn(payload) under key and return a Future of its (resolved) result."""
+        future = Future()
+        if threading.current_thread() is self.thread:
+            self._run({'fn': fn, 'payload': payload, 'resolve': resolve, 'waiters': [(future, payload)]})
+            return future
+        with self.condition:
+            self.stats['submitted'] += 1
+            job = self.pending.get(key)
+            if job is not None:
+                job['payload'] = merge(job['payload'], payload) if merge else payload
+                job['waiters'].append((future, payload))
+                self.stats['coalesced'] += 1
+                return future
+            job = {'key': key, 'fn': fn, 'payload': payload, 'resolve': resolve, 'waiters': [(future, payload)]}
+            self.pending[key] = job
+            self.jobs.append(job)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._work, name=f'{self.name}-queue', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return future
+
+    def queue_stats(self):
+        """Return submitted/coalesced/executed/failed counters and the current queue length."""
+        with self.condition:
+            return dict(self.stats, queued=len(self.jobs))
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.jobs:
+                    self.condition.wait()
+                job = self.jobs.popleft()
+                # From here on, new submits with this key queue a new job
+                if self.pending.get(job['key']) is job:
+                    del self.pending[job['key']]
+            self._run(job)
+
+    def _run(self, job):
+        try:
+            result = job['fn'](job['payload'])
+        except Exception as e:
+            logger.error(f"Router {job.get('key', 'inline')} job failed: {str(e)}")
+            with self.condition:
+                self.stats['failed'] += 1
+            for future, _ in job['waiters']:
+                future.set_exception(e)
+            return
+        with self.condition:
+            self.stats['executed'] += 1
+        for future, own in job['waiters']:
+            try:
+                future.set_result(job['resolve'](result, job['payload'], own) if job['resolve'] else result)
+            except Exception as e:
+                future.set_exception(e)
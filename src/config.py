@@ -1,38 +1,100 @@
 import os
-import json
+import fcntl
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-import logging
-import logging.handlers
+from policy import UsageState
+from usage_journal import UsageJournal, apply_event
+from history import UsageHistory
+from storage import JsonFileBackend, create_backend
+from log_pipeline import setup_logger, log_fields
+from metrics import CONFIG_LOADS, CONFIG_SAVES, CONFIG_SAVE_SECONDS, JOURNAL_EVENTS
 
-def setup_logger(name):
-    """Configure and return a logger with syslog handler."""
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+# Get logger
+logger = setup_logger('TIME.CONTROL')
 
-    # Remove any existing handlers
-    logger.handlers = []
+class _SharedLock:
+    """Re-entrant lock; when shared, holding it also excludes other processes, via flock on a lock file."""
+    def __init__(self, path, shared=False):
+        self.local = threading.RLock()
+        self.path = path
+        self.shared = shared
+        self.depth = 0
+        self.fd = None
 
-    # Create syslog handler
-    syslog_handler = logging.handlers.SysLogHandler(address='/dev/log')
-    syslog_handler.setLevel(logging.INFO)
+    def acquire(self):
+        self.local.acquire()
+        if not self.shared:
+            return
+        try:
+            if self.depth == 0:
+                if self.fd is None:
+                    self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+        except BaseException:
+            self.local.release()
+            raise
+        self.depth += 1
 
-    # Create formatter
-    formatter = logging.Formatter('%(name)s: %(levelname)s - %(message)s')
-    syslog_handler.setFormatter(formatter)
+    def release(self):
+        if self.shared:
+            self.depth -= 1
+            if self.depth == 0:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.local.release()
 
-    # Add handler to logger
-    logger.addHandler(syslog_handler)
+    def __enter__(self):
+        self.acquire()
+        return self
 
-    # Prevent propagation to root logger
-    logger.propagate = False
+    def __exit__(self, *exc):
+        self.release()
 
-    return logger
+class _DocumentCache:
+    """Parsed document shared by every Config instance that points at the same storage.
 
-# Get logger
-logger = setup_logger('TIME.CONTROL')
+    With shared=True (several worker processes on the same storage) its lock is also a
+    file lock, and changes to the usage journal by other processes invalidate it too.
+    """
+    def __init__(self, path, backend, shared=False):
+        self.path = path
+        self.backend = backend
+        self.lock = _SharedLock(path + '.lock', shared)
+        self.data = None
+        self.signature = None
+        self.hits = 0
+        self.reloads = 0
+        self.saves = 0
+        self.depth = 0
+        self.dirty = False
+        self.changes = set()
+        self.full_save = False
+        self.journal = UsageJournal(os.path.join(os.path.dirname(path), 'usage_events.log'))
+        self.applied_seq = 0
+        # Highest seq this process has seen; later events found on reload were recorded by other processes
+        self.seen_seq = None
+        self.foreign_events = []
+        self.pending_events = []
+        self.compacting = False
+        self.history = None
+        self.listeners = []
+
+_document_caches = {}
+_document_caches_lock = threading.Lock()
+
+def _get_document_cache(storage, base_dir, shared=False):
+    """Return the shared cache for a storage backend, creating it on first use."""
+    key = (storage, base_dir)
+    with _document_caches_lock:
+        cache = _document_caches.get(key)
+        if cache is None:
+            backend = create_backend(storage, base_dir)
+            cache = _DocumentCache(backend.path, backend, shared)
+            _document_caches[key] = cache
+        return cache
 
 class Config:
-    def __init__(self):
+    def __init__(self, profile=None):
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
         self.config = {
             'openwrt_ip': '192.168.0.1',
@@ -40,22 +102,69 @@ class Config:
             'username': 'jacob',
             'password': 'Jac0bm!@#G',
             'rule_name': 'max',
-            'network_check_ip': '192.168.0.10'
+            'network_check_ip': '192.168.0.10',
+            'network_check_targets': [],  # 'host' or 'host:port'; defaults to network_check_ip
+            'network_check_port': 53,  # a TCP port every target serves: 53 on a resolver or the router
+            'network_check_interval': 10,
+            'network_check_timeout': 1.0,
+            'network_fail_threshold': 3,
+            'network_recover_threshold': 2,
+            'network_restart_command': ['bash', '/home/jacob/bin/check_network.sh'],
+            'network_restart_backoff': 60,
+            # 'fake' runs against an in-memory router (see fake_router.py)
+            'router_backend': os.environ.get('KIDCONTROL_ROUTER_BACKEND', 'ssh'),
+            'fake_router': {'hosts': 20, 'latency': 0.05, 'jitter': 0.02, 'failure_rate': 0.0, 'flap_period': 0},
+            'ssh_pool_size': 2,
+            'ssh_keepalive': 15,
+            'ssh_persist': 600,
+            'ssh_connect_timeout': 5,
+            'router_timeouts': {'snapshot': 10, 'toggle': 20, 'reconnect': 15, 'default': 10},  # seconds per command
+            'router_breaker_failures': 3,
+            'router_breaker_reset': 30,
+            'reconcile_interval': 15,
+            'reconcile_backoff_max': 300,
+            'status_ttl': 30,
+            'status_stale_ttl': 300,
+            'router_dry_run': False,
+            'router_verify': False,
+            'scheduler_max_sleep': 600,
+            'sse_tick': 15,
+            'sse_heartbeat': 25,
+            'journal_compact_every': 100,
+            'storage': 'json',
+            # Worker processes serving the app (set by gunicorn.conf.py); above 1, storage is locked across processes
+            'workers': int(os.environ.get('KIDCONTROL_WORKERS', '1')),
+            'leader_retry': 5,
+            'leader_apply_timeout': 15,
+            'warmup_timeout': 10,
         }
         
         # File paths
         self.data_file = os.path.join(self.base_dir, 'data.json')
+        self.cache = _get_document_cache(self.config['storage'], self.base_dir, shared=self.config['workers'] > 1)
+        self.backend = self.cache.backend
+
+        # The top level of the document is the default profile; others live under 'profiles'
+        self.default_profile = self.config['rule_name']
+        self.profile = profile or self.default_profile
         
         # Initialize files if they don't exist
         self._initialize_files()
     
     def _initialize_files(self):
-        """Initialize configuration files if they don't exist."""
-        if not os.path.exists(self.data_file):
+        """Initialize the storage if it is empty, migrating an existing data.json to a new backend."""
+        with self.cache.lock:
+            if self.backend.exists():
+                return
+            if self.backend.path != self.data_file and os.path.exists(self.data_file):
+                self.backend.save(JsonFileBackend(self.data_file).load())
+                os.replace(self.data_file, self.data_file + '.migrated')
+                logger.info(f"Migrated {self.data_file} to {self.backend.path}")
+                return
             initial_data = {
                 'time_records': {},
                 'network_status': '',
-                'devices': [],
+                'devices': {},
                 'current_day': datetime.now().strftime('%Y-%m-%d'),
                 'task_status': {},
                 'settings': {
@@ -73,37 +182,82 @@ class Config:
                     'current': 0
                 }
             }
-            with open(self.data_file, 'w') as f:
-                json.dump(initial_data, f, indent=4)
+            self.backend.save(initial_data)
     
+    def _file_signature(self):
+        """Return the backend's change signature, or None if it can't be read.
+
+        When other processes share the storage, their journal appends count as changes too.
+        """
+        try:
+            if self.cache.lock.shared:
+                return (self.backend.signature(), self.cache.journal.signature())
+            return self.backend.signature()
+        except Exception:
+            return None
+
     def _load_data(self):
-        """Load data from JSON file."""
+        """Load data from the shared cache, re-reading the storage only when it changed."""
+        cache = self.cache
+        with cache.lock:
+            if cache.depth > 0 and cache.data is not None:
+                # Inside a transaction the in-memory document is authoritative
+                self.data = cache.data
+                return
+            signature = self._file_signature()
+            if cache.data is not None and signature is not None and signature == cache.signature:
+                cache.hits += 1
+                CONFIG_LOADS.inc(result='hit')
+                self.data = cache.data
+                return
+            cache.reloads += 1
+            CONFIG_LOADS.inc(result='reload')
+            self._parse_data()
+            # Replay the usage events recorded after the last checkpoint
+            cache.applied_seq = self.data.get('journal_seq', 0)
+            cache.journal.seed(cache.applied_seq)
+            for event in cache.journal.replay(cache.applied_seq):
+                cache.changes |= apply_event(self.data, event)
+                cache.applied_seq = event['seq']
+                if cache.seen_seq is not None and event['seq'] > cache.seen_seq and cache.listeners:
+                    cache.foreign_events.append(event)
+            cache.journal.seed(cache.applied_seq)
+            cache.seen_seq = max(cache.seen_seq or 0, cache.applied_seq)
+            cache.data = self.data
+            cache.signature = self._file_signature()
+
+    def _parse_data(self):
+        """Read the document from the storage backend, applying migrations."""
         try:
-            with open(self.data_file, 'r') as f:
-                self.data = json.load(f)
-                # Migrate old status to network_status if needed
-                if 'status' in self.data:
-                    self.data['network_status'] = self.data.pop('status')
+            self.data = self.backend.load()
+            self.cache.applied_seq = self.data.get('journal_seq', 0)
+            # Migrate old status to network_status if needed
+            if 'status' in self.data:
+                self.data['network_status'] = self.data.pop('status')
+                self._save_data()
+            # Drop the old pipe-joined device list; the inventory is rebuilt from the router
+            if isinstance(self.data.get('devices'), list):
+                self.data['devices'] = {}
+                self._save_data()
+            # Migrate from old config file if needed
+            if 'settings' not in self.data:
+                self.data['settings'] = {}
+                old_config_file = os.path.join(self.base_dir, 'kidcontrol.config')
+                if os.path.exists(old_config_file):
+                    with open(old_config_file, 'r') as f:
+                        for line in f:
+                            if '=' in line:
+                                key, value = line.strip().split('=')
+                                self.data['settings'][key] = int(value)
                     self._save_data()
-                # Migrate from old config file if needed
-                if 'settings' not in self.data:
-                    self.data['settings'] = {}
-                    old_config_file = os.path.join(self.base_dir, 'kidcontrol.config')
-                    if os.path.exists(old_config_file):
-                        with open(old_config_file, 'r') as f:
-                            for line in f:
-                                if '=' in line:
-                                    key, value = line.strip().split('=')
-                                    self.data['settings'][key] = int(value)
-                        self._save_data()
-                        # Optionally remove the old config file
-                        # os.remove(old_config_file)
+                    # Optionally remove the old config file
+                    # os.remove(old_config_file)
         except Exception as e:
-            logger.error(f"Error loading data file: {str(e)}")
+            logger.error(f"Error loading data from {self.backend.path}: {str(e)}")
             self.data = {
                 'time_records': {},
                 'network_status': '',
-                'devices': [],
+                'devices': {},
                 'current_day': datetime.now().strftime('%Y-%m-%d'),
                 'task_status': {},
                 'settings': {
@@ -122,37 +276,311 @@ class Config:
                 }
             }
     
+    def reload_changes(self):
+        """Re-read the storage if another process changed it since this one last read or wrote it.
+
+        The usage events the other process recorded are passed to this process's event
+        listeners, as if they had been recorded here. Returns whether anything changed.
+        """
+        cache = self.cache
+        with cache.lock:
+            changed = cache.data is not None and self._file_signature() != cache.signature
+            if changed:
+                self._load_data()
+            # Also the events found by reloads that requests of this process did in the meantime
+            events, cache.foreign_events = cache.foreign_events, []
+        self._notify(events)
+        return changed or bool(events)
+
     def get_data(self, key=None):
-        """Get fresh data from file. If key is provided, return that specific key's value."""
-        self._load_data()  # Always reload from file
+        """Get data, re-reading the storage only if it changed. If key is provided, return that key of this profile."""
+        self._load_data()  # Costs one stat() when the file is unchanged
         if key is not None:
-            return self.data.get(key, {} if isinstance(self.data.get(key), dict) else '')
+            profile = self._profile_data(self.data)
+            return profile.get(key, {} if isinstance(profile.get(key), dict) else '')
         return self.data
+
+    @property
+    def is_default_profile(self):
+        return self.profile == self.default_profile
+
+    def _profile_data(self, data):
+        """Return this profile's part of the document."""
+        if self.is_default_profile:
+            return data
+        return data['profiles'][self.profile]
+
+    def _change(self, section, key):
+        """Return the storage row touched when this profile changes section/key."""
+        if self.is_default_profile:
+            return (section, key)
+        return ('profiles', self.profile)
+
+    def get_profile_data(self):
+        """Get this profile's settings, time records, tasks and status."""
+        self._load_data()
+        return self._profile_data(self.data)
+
+    def profile_names(self):
+        """Return every profile, the default one first."""
+        data = self.get_data()
+        return [self.default_profile] + sorted(data.get('profiles', {}))
+
+    def profile_tag(self):
+        """Return the DHCP tag that marks this profile's devices on the router."""
+        return self.get_profile_data().get('tag') or self.profile.upper()
+
+    def add_profile(self, name, tag=None):
+        """Create a profile with its own counters, starting from the default profile's settings."""
+        with self.cache.lock:
+            data = self.get_data()
+            profiles = data.setdefault('profiles', {})
+            if name == self.default_profile or name in profiles:
+                raise ValueError(f"Profile {name} already exists")
+            profiles[name] = {
+                'tag': tag or name.upper(),
+                'settings': dict(data['settings'], current=0),
+                'time_records': {},
+                'task_status': {},
+                'devices': {},
+                'network_status': '',
+                'current_day': data.get('current_day', datetime.now().strftime('%Y-%m-%d')),
+            }
+            self._save_data({('profiles', name)})
     
-    def _save_data(self):
-        """Save data to JSON file."""
+    def _save_data(self, changes=None):
+        """Save data to storage, or defer the write until the open transaction commits.
+
+        changes is the set of (section, key) pairs modified; None means the whole document.
+        """
+        cache = self.cache
+        with cache.lock:
+            if cache.lock.shared and cache.depth == 0 and changes is not None and self._file_signature() != cache.signature:
+                self._reload_under(changes)
+            cache.data = self.data
+            if changes is None:
+                cache.full_save = True
+            else:
+                cache.changes |= set(changes)
+            if cache.depth > 0:
+                cache.dirty = True
+                return
+            self._write_data()
+
+    def _reload_under(self, changes):
+        """Another process wrote since this one loaded: re-read the storage and put the changed rows back on top."""
+        rows = {}
+        for section, key in changes:
+            part = self.data if not section else self.data.get(section, {})
+            rows[(section, key)] = (key in part, part.get(key))
+        self.cache.data = None
+        self.cache.signature = None
+        self._load_data()
+        for (section, key), (present, value) in rows.items():
+            part = self.data if not section else self.data.setdefault(section, {})
+            if present:
+                part[key] = value
+            else:
+                part.pop(key, None)
+
+    def _write_data(self):
+        """Commit the document (or only its changed rows) to the storage backend atomically."""
+        cache = self.cache
+        try:
+            # Every write is a checkpoint of the usage journal
+            cache.data['journal_seq'] = cache.applied_seq
+            changes = None if cache.full_save else cache.changes | {('', 'journal_seq')}
+            with CONFIG_SAVE_SECONDS.time():
+                self.backend.save(cache.data, changes)
+            CONFIG_SAVES.inc(kind='full' if changes is None else 'rows')
+            cache.full_save = False
+            cache.changes = set()
+            cache.saves += 1
+            cache.signature = self._file_signature()
+        except Exception as e:
+            cache.signature = None
+            logger.error(f"Error saving data to {self.backend.path}: {str(e)}")
+
+    @contextmanager
+    def transaction(self):
+        """Apply all mutations made inside the block in memory and commit them with a single write.
+
+        Transactions nest; only the outermost one writes. If the block raises, the pending
+        changes are discarded and the document is re-read from disk on next access.
+        """
+        cache = self.cache
+        events = []
+        with cache.lock:
+            self._load_data()
+            cache.depth += 1
+            try:
+                yield self
+            except BaseException:
+                cache.depth -= 1
+                if cache.depth == 0:
+                    cache.dirty = False
+                    cache.full_save = False
+                    cache.changes = set()
+                    cache.pending_events = []
+                    cache.data = None
+                    cache.signature = None
+                raise
+            cache.depth -= 1
+            if cache.depth == 0:
+                events, cache.pending_events = cache.pending_events, []
+                cache.journal.append(events)
+                if cache.dirty:
+                    cache.dirty = False
+                    self._write_data()
+                elif events and cache.lock.shared:
+                    # Our own append must not look like another process's change
+                    cache.signature = self._file_signature()
+        self._notify(events)
+        self._maybe_compact()
+
+    def record_event(self, event_type, **fields):
+        """Append a usage event to the journal and apply it to the in-memory document.
+
+        Costs one small append instead of a rewrite of data.json. Inside a transaction the
+        event is journaled when the transaction commits.
+        """
+        cache = self.cache
+        with cache.lock:
+            self._load_data()
+            if not self.is_default_profile:
+                fields['profile'] = self.profile
+            event = cache.journal.new_event(event_type, **fields)
+            cache.seen_seq = max(cache.seen_seq or 0, event['seq'])
+            JOURNAL_EVENTS.inc(type=event_type)
+            # Rows touched by events are written with the next checkpoint
+            cache.changes |= apply_event(cache.data, event)
+            cache.applied_seq = event['seq']
+            if cache.depth > 0:
+                cache.pending_events.append(event)
+                committed = []
+            else:
+                cache.journal.append([event])
+                committed = [event]
+                if cache.lock.shared:
+                    cache.signature = self._file_signature()
+        self._notify(committed)
+        self._maybe_compact()
+        return event
+
+    def add_event_listener(self, listener):
+        """Call listener(event) after every usage event is committed to the journal, in any Config."""
+        with self.cache.lock:
+            self.cache.listeners.append(listener)
+
+    def _notify(self, events):
+        for event in events:
+            for listener in list(self.cache.listeners):
+                try:
+                    listener(event)
+                except Exception as e:
+                    logger.error(f"Error in usage event listener: {str(e)}")
+
+    def _maybe_compact(self):
+        cache = self.cache
+        with cache.lock:
+            # Counted from the file under the (shared) lock, so appends by every worker count
+            if cache.compacting or cache.depth > 0 or cache.journal.size() < self.config.get('journal_compact_every', 100):
+                return
+            cache.compacting = True
+        threading.Thread(target=self.compact_journal, daemon=True).start()
+
+    def compact_journal(self):
+        """Checkpoint the document and move the folded-in events to the journal archive."""
+        cache = self.cache
         try:
-            with open(self.data_file, 'w') as f:
-                json.dump(self.data, f, indent=4)
+            with cache.lock:
+                self._load_data()
+                self._write_data()
+                checkpoint_seq = cache.applied_seq
+                if cache.lock.shared:
+                    # Another process must not append between the checkpoint and the rewrite of the
+                    # journal, or its events would count as seen here without being replayed
+                    moved = cache.journal.compact(checkpoint_seq)
+                    cache.signature = self._file_signature()
+            if not cache.lock.shared:
+                moved = cache.journal.compact(checkpoint_seq)
+            logger.info(f"Usage journal compacted: {moved} events archived up to seq {checkpoint_seq}")
         except Exception as e:
-            logger.error(f"Error saving data file: {str(e)}")
+            logger.error(f"Error compacting usage journal: {str(e)}")
+        finally:
+            cache.compacting = False
+
+    def version(self):
+        """Return a value that changes whenever the document does, without building anything from it.
+
+        Made of the saved state only (the storage signature and the seq of the last journal
+        event applied), so every worker process gives the same value for the same state.
+        """
+        cache = self.cache
+        with cache.lock:
+            self._load_data()
+            return (self.backend.signature(), cache.applied_seq)
+
+    def cache_stats(self):
+        """Return hit/reload/save counters of the shared document cache."""
+        cache = self.cache
+        return {'hits': cache.hits, 'reloads': cache.reloads, 'saves': cache.saves}
     
+    def snapshot(self):
+        """Return an immutable UsageState of this profile built from a single read of the document."""
+        return UsageState.from_document(self.get_profile_data())
+
     def get_network_status(self):
         """Get the current network status from data file."""
-        data = self.get_data()
+        data = self.get_profile_data()
         return data.get('network_status', 'unknown')
 
     def set_network_status(self, status):
-        """Set the current network status in data file."""
-        data = self.get_data()
-        data['network_status'] = status
-        self.data = data
-        self._save_data()
+        """Set the current network status in data file.
+
+        A requested restrict state that the status matches is marked applied (see set_desired_restrict()).
+        """
+        with self.cache.lock:
+            data = self.get_profile_data()
+            changes = set()
+            if data.get('network_status') != status:
+                data['network_status'] = status
+                changes.add(self._change('', 'network_status'))
+            desired = data.get('desired_restrict')
+            version = data.get('desired_version', 0)
+            if (desired is not None and status == ('disabled' if desired else 'enabled')
+                    and data.get('applied_version', 0) < version):
+                data['applied_version'] = version
+                changes.add(self._change('', 'applied_version'))
+            if changes:
+                self._save_data(changes)
     
+    def get_desired_restrict(self):
+        """Return the restrict state last requested for this profile's devices, or None if never requested."""
+        return self.get_profile_data().get('desired_restrict')
+
+    def set_desired_restrict(self, restrict, if_version=None):
+        """Persist the restrict state the router should converge to and return its version.
+
+        Every change of the state gets a new version; the request counts as applied once
+        the leader has raised applied_version to it. With if_version, nothing changes unless the desired
+        state is still at that version, i.e. nobody requested anything since.
+        """
+        with self.cache.lock:
+            data = self.get_profile_data()
+            if if_version is not None and data.get('desired_version', 0) != if_version:
+                return data.get('desired_version', 0)
+            if data.get('desired_restrict') == restrict:
+                return data.get('desired_version', 0)
+            data['desired_restrict'] = restrict
+            data['desired_version'] = data.get('desired_version', 0) + 1
+            self._save_data({self._change('', 'desired_restrict'), self._change('', 'desired_version')})
+            return data['desired_version']
+
     def get_config_value(self, key):
         """Get a value from settings."""
         try:
-            data = self.get_data()
+            data = self.get_profile_data()
             return str(data['settings'].get(key))
         except Exception as e:
             logger.error(f"Error reading config value for {key}: {str(e)}")
@@ -161,7 +589,7 @@ class Config:
     def set_config_value(self, key, value):
         """Set a value in settings."""
         try:
-            data = self.get_data()
+            data = self.get_profile_data()
             if key in ['starting', 'ending']:
                 # Handle time format "hour:minutes"
                 if ':' not in str(value):
@@ -174,15 +602,14 @@ class Config:
                 data['settings'][key] = value
             else:
                 data['settings'][key] = int(value)
-            self.data = data
-            self._save_data()
+            self._save_data({self._change('settings', key)})
         except Exception as e:
             logger.error(f"Error setting config value for {key}: {str(e)}")
     
     def get_time_record(self, key):
         """Get a value from time records."""
         try:
-            data = self.get_data()
+            data = self.get_profile_data()
             return str(data['time_records'].get(key, "0"))
         except Exception as e:
             logger.error(f"Error reading time record for {key}: {str(e)}")
@@ -191,44 +618,85 @@ class Config:
     def set_time_record(self, key, value):
         """Set a value in time records."""
         try:
-            data = self.get_data()
+            data = self.get_profile_data()
             data['time_records'][key] = value
-            self.data = data
-            self._save_data()
+            self._save_data({self._change('time_records', key)})
         except Exception as e:
             logger.error(f"Error setting time record for {key}: {str(e)}")
     
     def remove_time_record(self, key):
         """Remove a value from time records."""
         try:
-            data = self.get_data()
+            data = self.get_profile_data()
             if key in data['time_records']:
                 del data['time_records'][key]
-                self.data = data
-                self._save_data()
+                self._save_data({self._change('time_records', key)})
         except Exception as e:
             logger.error(f"Error removing time record for {key}: {str(e)}")
     
+    @property
+    def history(self):
+        """The shared per-day usage archive (history.db next to data.json)."""
+        cache = self.cache
+        with cache.lock:
+            if cache.history is None:
+                cache.history = UsageHistory(os.path.join(self.base_dir, 'history.db'))
+            return cache.history
+
+    @property
+    def history_key(self):
+        """This profile's name in the history archive; None for the default profile."""
+        return None if self.is_default_profile else self.profile
+
     def reset_current_usage(self):
-        """Reset current usage and log the previous day's usage."""
+        """Archive the previous day's usage and tasks, then reset the counters for today."""
         current_day = datetime.now().strftime('%Y-%m-%d')
         
         try:
-            data = self.get_data()
+            data = self.get_profile_data()
             previous_day = data['current_day']
             
             if current_day != previous_day:
-                # Reset all counters
+                settings = data['settings']
+                records = data.get('time_records', {})
+                task_status = data.get('task_status', {})
+                try:
+                    # Older days left in task_status by earlier versions only have their tasks
+                    for day in sorted(task_status):
+                        if day != previous_day:
+                            self.history.merge_tasks(day, task_status[day], profile=self.history_key)
+                    try:
+                        weekday = datetime.strptime(previous_day, '%Y-%m-%d').strftime('%a').lower()
+                    except ValueError:
+                        weekday = None
+                    self.history.archive_day(
+                        previous_day,
+                        profile=self.history_key,
+                        quota=settings.get(weekday, 0) if weekday else 0,
+                        minutes_used=settings.get('current', 0),
+                        elapsed=records.get('elapsed_time', 0) or 0,
+                        rest_taken=records.get('rest_time', 0) or 0,
+                        force_stops=records.get('force_stops', 0) or 0,
+                        tasks=task_status.get(previous_day, {}),
+                    )
+                    logger.info(f"Kid_control: {self.profile} {previous_day}: {settings.get('current', 0)} mins used, archived")
+                except Exception as e:
+                    # Never block the rollover on the archive
+                    logger.error(f"Error archiving usage of {previous_day}: {str(e)}")
+
+                # Reset all counters; the live document only keeps today
                 data['settings']['current'] = 0
                 data['current_day'] = current_day
                 data['time_records'] = {
                     'elapsed_time': '0',
                     'rest_time': '0'
                 }
-                self.data = data
-                self._save_data()
+                data['task_status'] = {}
+                # Only these rows: with several workers the rest is re-read from storage before the write
+                self._save_data({self._change('settings', 'current'), self._change('', 'current_day'),
+                                 self._change('', 'time_records'), self._change('', 'task_status')})
                 current_usage = self.get_config_value('current')
-                logger.info(f"Kid_control: {current_day}: {current_usage} mins newly set")
+                logger.info(f"Kid_control: {self.profile} {current_day}: {current_usage} mins newly set")
                
         except Exception as e:
             logger.error(f"Error resetting current usage: {str(e)}")
@@ -247,13 +715,13 @@ class Config:
             raise
 
     def get_devices(self):
-        """Get the list of devices from data file."""
-        data = self.get_data()
-        return data.get('devices', [])
+        """Get the device inventory from data file, keyed by MAC."""
+        data = self.get_profile_data()
+        devices = data.get('devices', {})
+        return devices if isinstance(devices, dict) else {}
 
     def set_devices(self, devices):
-        """Set the list of devices in data file."""
-        data = self.get_data()
+        """Set the device inventory (keyed by MAC) in data file."""
+        data = self.get_profile_data()
         data['devices'] = devices
-        self.data = data
-        self._save_data() 
\ No newline at end of file
+        self._save_data({self._change('', 'devices')}) 
\ No newline at end of file
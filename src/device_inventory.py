@@ -0,0 +1,64 @@
+import threading
+import time
+from config import setup_logger
+
+# Get logger
+logger = setup_logger('ROUTER.CONTROL')
+
+# Fields that are written to data.json; last_seen of an online device only lives in memory
+_PERSISTED_FIELDS = ('name', 'tags', 'online')
+
+class DeviceInventory:
+    """In-memory inventory of the devices carrying a tag, backed by the 'devices' map in data.json.
+
+    Records are keyed by MAC: {'name': str, 'tags': [str], 'online': bool, 'last_seen': int}.
+    Each update diffs the new router snapshot against the previous records and only
+    writes data.json when a device appeared, disappeared or changed name, tags or online state.
+    """
+    def __init__(self, config, tag):
+        self.config = config
+        self.tag = tag
+        self.lock = threading.Lock()
+        self.devices = {mac: dict(record) for mac, record in config.get_devices().items()}
+        self.updated_at = 0.0
+
+    def update(self, snapshot):
+        """Merge a RouterSnapshot into the inventory. Returns True if data.json was written."""
+        now = int(snapshot.taken_at or time.time())
+        with self.lock:
+            current = {}
+            for host in snapshot.tagged(self.tag):
+                for mac in host.macs:
+                    previous = self.devices.get(mac, {})
+                    online = bool(snapshot.associated_interfaces(mac))
+                    current[mac] = {
+                        'name': host.name,
+                        'tags': list(host.tags),
+                        'online': online,
+                        'last_seen': now if online else previous.get('last_seen', 0),
+                    }
+            changed = set(current) != set(self.devices) or any(
+                current[mac][field] != self.devices[mac].get(field)
+                for mac in current for field in _PERSISTED_FIELDS
+            )
+            self.devices = current
+            self.updated_at = time.monotonic()
+        if changed:
+            logger.info(f"Device inventory changed: {len(current)} {self.tag} devices, "
+                        f"{sum(1 for record in current.values() if record['online'])} online")
+            self.config.set_devices(current)
+        return changed
+
+    def reload(self):
+        """Re-read the records from data.json, where another process may have updated them."""
+        devices = {mac: dict(record) for mac, record in self.config.get_devices().items()}
+        with self.lock:
+            self.devices = devices
+
+    def list(self):
+        """Return the devices as a list of dicts sorted by name, MAC included."""
+        with self.lock:
+            return sorted(
+                (dict(record, mac=mac) for mac, record in self.devices.items()),
+                key=lambda record: (record['name'], record['mac'])
+            )
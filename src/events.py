@@ -0,0 +1,114 @@
+import json
+import queue
+import threading
+from config import setup_logger
+
+# Get logger
+logger = setup_logger('KID.CONTROL')
+
+# Usage journal event -> dashboard event name
+TRANSITIONS = {
+    'start': 'started',
+    'stop': 'stopped',
+    'adjust': 'adjusted',
+}
+
+def format_sse(event, data):
+    """Serialize one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, sort_keys=True)}\n\n"
+
+class EventPublisher:
+    """Fans dashboard events out to every connected /events client.
+
+    Each event is computed and serialized once, then the same text is queued for every
+    subscriber of that profile. A ticker thread publishes the countdowns of the watched
+    profiles every tick_interval seconds, and only while someone is listening.
+    compute(profile) returns the dashboard view model of a profile.
+    """
+    def __init__(self, compute, tick_interval=15, queue_size=32):
+        self.compute = compute
+        self.tick_interval = tick_interval
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.last_tick = {}
+        self.ticker = None
+        self.stop_event = threading.Event()
+        self.stats = {'published': 0, 'computed': 0, 'dropped': 0}
+
+    def subscribe(self, profile):
+        """Register a client and return its queue of serialized events."""
+        client = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers[client] = profile
+            last = self.last_tick.get(profile)
+            if self.ticker is None or not self.ticker.is_alive():
+                self.stop_event.clear()
+                self.ticker = threading.Thread(target=self._tick_loop, daemon=True)
+                self.ticker.start()
+        if last is not None:
+            client.put_nowait(last)
+        return client
+
+    def unsubscribe(self, client):
+        with self.lock:
+            self.subscribers.pop(client, None)
+
+    def client_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    def publish(self, profile, event, data):
+        """Queue one event for every client watching the profile."""
+        message = format_sse(event, data)
+        with self.lock:
+            clients = [client for client, watched in self.subscribers.items() if watched == profile]
+            self.stats['published'] += 1
+            if event == 'tick':
+                self.last_tick[profile] = message
+        for client in clients:
+            try:
+                client.put_nowait(message)
+            except queue.Full:
+                # A stalled client only misses events; the next tick brings it up to date
+                with self.lock:
+                    self.stats['dropped'] += 1
+        return message
+
+    def on_usage_event(self, profile, event):
+        """Publish a state transition for a committed usage journal event."""
+        name = TRANSITIONS.get(event.get('type'))
+        if name is None:
+            return
+        if name == 'stopped' and event.get('reason', 'manual') != 'manual':
+            name = 'force_stopped'
+        with self.lock:
+            if profile not in self.subscribers.values():
+                return
+        data = {key: value for key, value in event.items() if key not in ('seq', 'profile')}
+        data['status'] = self._compute(profile)
+        self.publish(profile, name, data)
+        # The countdowns changed with the state: tick right away
+        self.publish(profile, 'tick', data['status'])
+
+    def _compute(self, profile):
+        with self.lock:
+            self.stats['computed'] += 1
+        return self.compute(profile)
+
+    def _tick_loop(self):
+        while not self.stop_event.wait(self.tick_interval):
+            with self.lock:
+                profiles = set(self.subscribers.values())
+                if not profiles:
+                    self.ticker = None
+                    self.last_tick.clear()
+                    return
+            for profile in profiles:
+                try:
+                    self.publish(profile, 'tick', self._compute(profile))
+                except Exception as e:
+                    logger.error(f"Error publishing countdown for {profile}: {str(e)}")
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,191 @@
+import random
+import re
+import subprocess
+import threading
+import time
+from config import setup_logger
+from router_snapshot import SNAPSHOT_COMMAND, IFACE_MARKER, DEAUTH_MARKER, RESTRICT_TAG
+from ssh_pool import TIMEOUT_EXIT, CommandLatency
+
+# Get logger
+logger = setup_logger('ROUTER.CONTROL')
+
+_UCI_LIST_RE = re.compile(r"^uci (add_list|del_list) '(dhcp\.@host\[(\d+)\])\.tag=([^']*)'$")
+_DEAUTH_RE = re.compile(r'^hostapd_cli -i (\S+) deauthenticate (\S+)')
+
+class FakeRouter:
+    """In-memory OpenWrt stand-in with the same run()/latency_stats()/close() interface as SSHSessionPool.
+
+    Emulates what RouterControl uses: `uci show dhcp` over a table of `config host`
+    sections with tags, `iwinfo assoclist` per wireless interface, `uci add_list/del_list`
+    on host tags, `uci commit`, the dnsmasq reload and `hostapd_cli deauthenticate`.
+    A deauthenticated device re-associates after reassociate_after seconds.
+
+    Latency is latency seconds (or a {label: seconds} dict) plus up to jitter seconds.
+    failure_rate is the chance a command fails like a dropped SSH connection (exit 255);
+    with flap_period set, the router alternates between up and down every flap_period seconds.
+    """
+    def __init__(self, hosts=20, tags=('MAX',), interfaces=('phy0-ap0', 'phy1-ap0'), associated=0.6,
+                 latency=0.0, jitter=0.0, failure_rate=0.0, flap_period=0, reassociate_after=5.0, seed=None):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.interfaces = tuple(interfaces)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.flap_period = flap_period
+        self.reassociate_after = reassociate_after
+        self.started = time.monotonic()
+        self.down = False
+        self.hosts = []
+        self.associations = {iface: {} for iface in self.interfaces}
+        self.latency_counters = CommandLatency()
+        self.commits = 0
+        self.reloads = 0
+        self.deauths = 0
+        for index in range(hosts):
+            # Tagged devices first, round-robin over the tags; every third host is untagged, like a TV or printer
+            tag = tags[index % len(tags)] if tags and index % 3 != 2 else None
+            mac = ':'.join(f'{b:02X}' for b in (0x02, 0x00, (index >> 16) & 0xFF, (index >> 8) & 0xFF, index & 0xFF, 0x01))
+            self.add_host(f'{(tag or "guest").lower()}-device-{index}', mac, [tag] if tag else [],
+                          self.interfaces[index % len(self.interfaces)] if self.rng.random() < associated else None)
+
+    def add_host(self, name, mac, tags, iface=None):
+        """Add a `config host` section, associated with iface if given. Returns its index."""
+        with self.lock:
+            self.hosts.append({'name': name, 'macs': [mac.upper()], 'tags': list(tags)})
+            if iface:
+                self.associations[iface][mac.upper()] = None
+            return len(self.hosts) - 1
+
+    def set_down(self, down=True):
+        """Make every command fail as if the router were unreachable."""
+        self.down = down
+
+    def is_down(self):
+        if self.down:
+            return True
+        if self.flap_period:
+            return int((time.monotonic() - self.started) / self.flap_period) % 2 == 1
+        return False
+
+    def run(self, command, label=None, timeout=None, retry=False):
+        """Run a command the way the router's shell would and return a CompletedProcess."""
+        label = label or command.split()[0]
+        start = time.monotonic()
+        delay = self.latency.get(label, self.latency.get('default', 0.0)) if isinstance(self.latency, dict) else self.latency
+        delay += self.rng.uniform(0, self.jitter) if self.jitter else 0.0
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            self.latency_counters.record(label, time.monotonic() - start)
+            return subprocess.CompletedProcess(command, TIMEOUT_EXIT, '', f'timed out after {timeout}s\n')
+        if delay:
+            time.sleep(delay)
+        if self.is_down() or (self.failure_rate and self.rng.random() < self.failure_rate):
+            result = subprocess.CompletedProcess(command, 255, '', 'ssh: connect to host fake-router port 22: Connection timed out\n')
+        else:
+            with self.lock:
+                self._reassociate()
+                result = self._execute(command)
+        self.latency_counters.record(label, time.monotonic() - start)
+        return result
+
+    def _execute(self, command):
+        if command == SNAPSHOT_COMMAND:
+            return subprocess.CompletedProcess(command, 0, self._uci_show() + self._assoclists(), '')
+        if '; ' in command:
+            stdout = ''.join(self._execute(step).stdout for step in command.split('; '))
+            return subprocess.CompletedProcess(command, 0, stdout, '')
+        match = _UCI_LIST_RE.match(command)
+        if match:
+            op, path, index, value = match.group(1), match.group(2), int(match.group(3)), match.group(4)
+            if index >= len(self.hosts):
+                return subprocess.CompletedProcess(command, 1, '', f'uci: Entry not found ({path})\n')
+            tags = self.hosts[index]['tags']
+            if op == 'add_list':
+                tags.append(value)
+            elif value in tags:
+                tags.remove(value)
+            return subprocess.CompletedProcess(command, 0, '', '')
+        if command == 'uci commit dhcp':
+            self.commits += 1
+            return subprocess.CompletedProcess(command, 0, '', '')
+        if command == '/etc/init.d/dnsmasq reload':
+            self.reloads += 1
+            return subprocess.CompletedProcess(command, 0, '', '')
+        match = _DEAUTH_RE.match(command)
+        if match:
+            iface, mac = match.group(1), match.group(2).upper()
+            associated = iface in self.associations and mac in self.associations[iface]
+            if associated:
+                self.deauths += 1
+                self.associations[iface][mac] = time.monotonic() + self.reassociate_after
+            if DEAUTH_MARKER in command:
+                return subprocess.CompletedProcess(command, 0, f"{DEAUTH_MARKER} {mac} {'ok' if associated else 'fail'}\n", '')
+            return subprocess.CompletedProcess(command, 0 if associated else 1, 'OK\n' if associated else 'FAIL\n', '')
+        if ' && ' in command:
+            # The toggle: every step must succeed for the next one to run
+            stdout = ''
+            for step in command.split(' && '):
+                result = self._execute(step)
+                stdout += result.stdout
+                if result.returncode != 0:
+                    return subprocess.CompletedProcess(command, result.returncode, stdout, result.stderr)
+            return subprocess.CompletedProcess(command, 0, stdout, '')
+        if command in ('true', 'echo ok'):
+            return subprocess.CompletedProcess(command, 0, 'ok\n' if command != 'true' else '', '')
+        return subprocess.CompletedProcess(command, 127, '', f"sh: {command.split()[0]}: not found\n")
+
+    def _reassociate(self):
+        now = time.monotonic()
+        for macs in self.associations.values():
+            for mac, away_until in macs.items():
+                if away_until is not None and away_until <= now:
+                    macs[mac] = None
+
+    def _uci_show(self):
+        lines = []
+        for index, host in enumerate(self.hosts):
+            path = f'dhcp.@host[{index}]'
+            lines.append(f'{path}=host')
+            lines.append(f"{path}.name='{host['name']}'")
+            lines.append(f"{path}.mac=" + ' '.join(f"'{mac}'" for mac in host['macs']))
+            if host['tags']:
+                lines.append(f"{path}.tag=" + ' '.join(f"'{tag}'" for tag in host['tags']))
+        return '\n'.join(lines) + '\n'
+
+    def _assoclists(self):
+        out = ''
+        for iface in self.interfaces:
+            out += f'{IFACE_MARKER} {iface}\n'
+            for mac, away_until in self.associations[iface].items():
+                if away_until is None:
+                    out += f'{mac}  -52 dBm / -95 dBm (SNR 43)  10 ms ago\n'
+        return out
+
+    def restricted(self, tag):
+        """Return how many hosts with the tag carry the restrict tag, for checks in tests and benchmarks."""
+        with self.lock:
+            return sum(1 for host in self.hosts if tag in host['tags'] and RESTRICT_TAG in host['tags'])
+
+    def latency_stats(self):
+        """Return per-command latency counters, plus commit/reload/deauth counts."""
+        stats = self.latency_counters.snapshot()
+        with self.lock:
+            return dict(stats, commits=self.commits, reloads=self.reloads, deauths=self.deauths)
+
+    def close(self):
+        pass
+
+_fake_routers = {}
+_fake_routers_lock = threading.Lock()
+
+def get_fake_router(host, **options):
+    """Return the shared fake router standing in for a host, creating it on first use."""
+    with _fake_routers_lock:
+        router = _fake_routers.get(host)
+        if router is None:
+            router = FakeRouter(**options)
+            _fake_routers[host] = router
+            logger.info(f"Using a fake router for {host} with {len(router.hosts)} hosts")
+        return router
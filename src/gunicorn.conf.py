@@ -0,0 +1,29 @@
+"""gunicorn settings for serving kid_control with several worker processes.
+
+    uv run --with gunicorn gunicorn -c gunicorn.conf.py wsgi:app
+
+Every worker serves requests; the one holding the leader lease (see leader.py) also
+runs enforcement and changes the router, and the others take over if it exits.
+"""
+import os
+
+bind = os.environ.get('KIDCONTROL_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('KIDCONTROL_WORKERS', '3'))
+# /events keeps a connection open per dashboard: threads, not processes, wait on them
+worker_class = 'gthread'
+threads = int(os.environ.get('KIDCONTROL_THREADS', '8'))
+timeout = 60
+graceful_timeout = 20
+# Each worker must import the app itself, after the fork, so its threads and locks are its own
+preload_app = False
+
+# Read by Config in every worker: storage gets cross-process locking and a leader is elected
+os.environ['KIDCONTROL_WORKERS'] = str(workers)
+
+def worker_exit(server, worker):
+    """Stop the background work and release the leader lease so another worker takes over."""
+    try:
+        from app import shutdown
+    except Exception:
+        return
+    shutdown()
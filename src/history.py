@@ -0,0 +1,113 @@
+import json
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_usage (
+    profile TEXT NOT NULL DEFAULT '',
+    day TEXT NOT NULL,
+    week TEXT NOT NULL,
+    month TEXT NOT NULL,
+    quota INTEGER NOT NULL DEFAULT 0,
+    minutes_used INTEGER NOT NULL DEFAULT 0,
+    elapsed INTEGER NOT NULL DEFAULT 0,
+    rest_taken INTEGER NOT NULL DEFAULT 0,
+    force_stops INTEGER NOT NULL DEFAULT 0,
+    tasks TEXT NOT NULL DEFAULT '{}',
+    PRIMARY KEY (profile, day)
+);
+CREATE INDEX IF NOT EXISTS daily_usage_profile_week ON daily_usage (profile, week);
+CREATE INDEX IF NOT EXISTS daily_usage_profile_month ON daily_usage (profile, month);
+"""
+
+def _week_of(day):
+    year, week, _ = date.fromisoformat(day).isocalendar()
+    return f'{year}-W{week:02d}'
+
+class UsageHistory:
+    """Per-day usage archive in SQLite, filled at the day rollover.
+
+    Keeps the live data.json down to today's state while past days stay queryable.
+    Weekly and monthly summaries are answered from indexed columns.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _key(profile):
+        # The default profile is stored as ''
+        return profile or ''
+
+    def archive_day(self, day, quota=0, minutes_used=0, elapsed=0, rest_taken=0, force_stops=0, tasks=None,
+                    profile=None):
+        """Store (or merge into) the record of one day. Safe to repeat after a crash."""
+        tasks = dict(tasks or {})
+        profile = self._key(profile)
+        with self.lock, self.conn:
+            row = self.conn.execute('SELECT tasks FROM daily_usage WHERE profile = ? AND day = ?',
+                                    (profile, day)).fetchone()
+            if row is not None:
+                tasks = dict(json.loads(row['tasks']), **tasks)
+            self.conn.execute(
+                'INSERT OR REPLACE INTO daily_usage '
+                '(profile, day, week, month, quota, minutes_used, elapsed, rest_taken, force_stops, tasks) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (profile, day, _week_of(day), day[:7], int(quota), int(minutes_used), int(elapsed),
+                 int(rest_taken), int(force_stops), json.dumps(tasks, sort_keys=True))
+            )
+
+    def merge_tasks(self, day, tasks, profile=None):
+        """Add completed tasks to a day without touching its counters."""
+        profile = self._key(profile)
+        with self.lock, self.conn:
+            row = self.conn.execute('SELECT tasks FROM daily_usage WHERE profile = ? AND day = ?',
+                                    (profile, day)).fetchone()
+            if row is None:
+                self.conn.execute(
+                    'INSERT INTO daily_usage (profile, day, week, month, tasks) VALUES (?, ?, ?, ?, ?)',
+                    (profile, day, _week_of(day), day[:7], json.dumps(dict(tasks), sort_keys=True))
+                )
+            else:
+                merged = dict(json.loads(row['tasks']), **tasks)
+                self.conn.execute('UPDATE daily_usage SET tasks = ? WHERE profile = ? AND day = ?',
+                                  (json.dumps(merged, sort_keys=True), profile, day))
+
+    def get_day(self, day, profile=None):
+        """Return the archived record of a day as a dict, or None."""
+        with self.lock:
+            row = self.conn.execute('SELECT * FROM daily_usage WHERE profile = ? AND day = ?',
+                                    (self._key(profile), day)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record['tasks'] = json.loads(record['tasks'])
+        return record
+
+    def _summary(self, column, since, profile):
+        with self.lock:
+            rows = self.conn.execute(
+                f'SELECT {column} AS period, COUNT(*) AS days, SUM(quota) AS quota, '
+                'SUM(minutes_used) AS minutes_used, SUM(elapsed) AS elapsed, '
+                'SUM(rest_taken) AS rest_taken, SUM(force_stops) AS force_stops '
+                f'FROM daily_usage WHERE profile = ? AND {column} >= ? GROUP BY {column} ORDER BY {column}',
+                (self._key(profile), since)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def weekly_summary(self, weeks=4, today=None, profile=None):
+        """Totals per ISO week for the last `weeks` weeks."""
+        today = today or date.today()
+        return self._summary('week', _week_of((today - timedelta(weeks=weeks - 1)).isoformat()), profile)
+
+    def monthly_summary(self, months=12, today=None, profile=None):
+        """Totals per calendar month for the last `months` months."""
+        today = today or date.today()
+        year, month = today.year, today.month - (months - 1)
+        while month < 1:
+            year, month = year - 1, month + 12
+        return self._summary('month', f'{year}-{month:02d}', profile)
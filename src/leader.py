@@ -0,0 +1,92 @@
+import fcntl
+import os
+import threading
+from config import setup_logger
+
+# Get logger
+logger = setup_logger('KID.CONTROL')
+
+class LeaderLease:
+    """Elects one process, among the workers sharing a data directory, to run the background work.
+
+    The lease is an exclusive flock on a file. The kernel drops it when the holder exits
+    or dies, so a crashed leader is replaced by another worker within retry seconds.
+    on_acquire() runs when this process becomes the leader, on_release() when it steps down.
+    """
+    def __init__(self, path, on_acquire=None, on_release=None, retry=5):
+        self.path = path
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self.retry = retry
+        self.fd = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def is_leader(self):
+        return self.fd is not None
+
+    def try_acquire(self):
+        """Take the lease if it is free. Returns whether this process holds it."""
+        with self.lock:
+            if self.fd is not None:
+                return True
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            os.ftruncate(fd, 0)
+            os.write(fd, f'{os.getpid()}\n'.encode())
+            self.fd = fd
+        logger.info(f"Process {os.getpid()} is now the leader: running enforcement and router changes")
+        if self.on_acquire is not None:
+            self.on_acquire()
+        return True
+
+    def start(self):
+        """Try for the lease now and keep trying in the background until it is held."""
+        if self.try_acquire():
+            return
+        self.stop_event.clear()
+
+        def acquire_loop():
+            while not self.stop_event.wait(self.retry):
+                try:
+                    if self.try_acquire():
+                        return
+                except Exception as e:
+                    logger.error(f"Error acquiring the leader lease: {str(e)}")
+
+        self.thread = threading.Thread(target=acquire_loop, daemon=True, name='leader-lease')
+        self.thread.start()
+
+    def release(self):
+        """Stop the background work if this process leads, and give the lease up."""
+        self.stop_event.set()
+        with self.lock:
+            fd, self.fd = self.fd, None
+        if fd is None:
+            return
+        try:
+            if self.on_release is not None:
+                self.on_release()
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+            logger.info(f"Process {os.getpid()} released the leader lease")
+
+_lease = None
+
+def set_lease(lease):
+    """Make this process one of several workers, leading only while it holds lease."""
+    global _lease
+    _lease = lease
+
+def is_leader():
+    """Return whether this process may run enforcement and change the router.
+
+    Without a lease (a single process) it always may.
+    """
+    return _lease is None or _lease.is_leader()
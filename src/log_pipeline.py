@@ -0,0 +1,141 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+SYSLOG_ADDRESS = '/dev/log'
+# Keyed messages (see log_fields) are let through at most this often while their state holds
+RATE_LIMIT_SECONDS = 600
+QUEUE_SIZE = 10000
+
+def log_fields(key=None, state=None, **fields):
+    """Return the `extra` for a structured log call.
+
+    fields are appended to the line as key=value pairs. Records with a key are rate
+    limited: one per RATE_LIMIT_SECONDS, or right away when their state changes.
+    """
+    return {'fields': fields, 'rate_key': key, 'rate_state': state}
+
+class KeyValueFormatter(logging.Formatter):
+    """Formats `NAME: level=INFO msg="..." key=value ...`."""
+    def format(self, record):
+        parts = [f'{record.name}: level={record.levelname}', f'msg={_quote(record.getMessage())}']
+        for name, value in (getattr(record, 'fields', None) or {}).items():
+            parts.append(f'{name}={_quote(value)}')
+        line = ' '.join(parts)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += ' exc=' + _quote(record.exc_text)
+        return line
+
+def _quote(value):
+    text = str(value)
+    if text and not any(c in text for c in ' "=\n'):
+        return text
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+class RateLimitFilter(logging.Filter):
+    """Drops repeats of keyed records; the next one that passes carries the suppressed count."""
+    def __init__(self, interval=RATE_LIMIT_SECONDS):
+        super().__init__()
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last = {}
+
+    def filter(self, record):
+        key = getattr(record, 'rate_key', None)
+        if key is None:
+            return True
+        state = getattr(record, 'rate_state', None)
+        if state is None:
+            state = record.getMessage()
+        now = time.monotonic()
+        with self.lock:
+            entry = self.last.get(key)
+            if entry is not None and entry[1] == state and now - entry[0] < self.interval:
+                entry[2] += 1
+                return False
+            suppressed = entry[2] if entry is not None else 0
+            self.last[key] = [now, state, 0]
+        if suppressed:
+            record.fields = dict(getattr(record, 'fields', None) or {}, suppressed=suppressed)
+        return True
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without blocking; drops them if it falls far behind.
+
+    The writer thread is started by the first record, so importing a module that sets up
+    a logger starts nothing.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.listener = None
+        self.listener_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Formatting is left to the writer thread; only make the record safe to pass across
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.listener is None:
+            self._start_writer()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start_writer(self):
+        with self.listener_lock:
+            if self.listener is None:
+                listener = logging.handlers.QueueListener(self.queue, _output_handler())
+                listener.start()
+                atexit.register(listener.stop)
+                self.listener = listener
+
+def _output_handler():
+    if os.path.exists(SYSLOG_ADDRESS):
+        handler = logging.handlers.SysLogHandler(address=SYSLOG_ADDRESS)
+    else:
+        # No syslog socket (containers, dev boxes): write to stderr instead
+        handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(KeyValueFormatter())
+    return handler
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def _get_pipeline():
+    """Create the queue and its handler on first use."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = _QueueHandler(queue.Queue(maxsize=QUEUE_SIZE))
+            _pipeline.addFilter(RateLimitFilter())
+        return _pipeline
+
+def setup_logger(name):
+    """Return a logger that writes through the shared background queue; safe to call repeatedly."""
+    logger = logging.getLogger(name)
+    handler = _get_pipeline()
+    if handler not in logger.handlers:
+        logger.setLevel(logging.INFO)
+        logger.handlers = [handler]
+        # Prevent propagation to root logger
+        logger.propagate = False
+    return logger
+
+def dropped_records():
+    """Return how many records were dropped because the writer queue was full."""
+    return _pipeline.dropped if _pipeline else 0
@@ -0,0 +1,160 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers a cached read (sub-millisecond) up to a slow SSH exec
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels_text(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, registry, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            for key in sorted(self.values):
+                lines += self._render_value(key, self.values[key])
+        return lines
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def _render_value(self, key, value):
+        return [f'{self.name}{_labels_text(self.label_names, key)} {value}']
+
+class Gauge(_Metric):
+    """A value that goes up and down."""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def _render_value(self, key, value):
+        return [f'{self.name}{_labels_text(self.label_names, key)} {value}']
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(registry, name, help_text, labels)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def _render_value(self, key, entry):
+        counts, total, count = entry
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{_labels_text(self.label_names + ("le",), key + (bound,))} {cumulative}')
+        lines.append(f'{self.name}_bucket{_labels_text(self.label_names + ("le",), key + ("+Inf",))} {count}')
+        lines.append(f'{self.name}_sum{_labels_text(self.label_names, key)} {total}')
+        lines.append(f'{self.name}_count{_labels_text(self.label_names, key)} {count}')
+        return lines
+
+class Registry:
+    """The set of metrics exposed at /metrics."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics[metric.name] = metric
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self.lock:
+            metrics = [self.metrics[name] for name in sorted(self.metrics)]
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+# Config
+CONFIG_LOADS = Counter(REGISTRY, 'kidcontrol_config_loads_total',
+                       'Document reads, by result (hit: served from memory, reload: read from storage)', ('result',))
+CONFIG_SAVES = Counter(REGISTRY, 'kidcontrol_config_saves_total', 'Document writes to storage, by kind', ('kind',))
+CONFIG_SAVE_SECONDS = Histogram(REGISTRY, 'kidcontrol_config_save_seconds', 'Duration of document writes')
+JOURNAL_EVENTS = Counter(REGISTRY, 'kidcontrol_journal_events_total', 'Usage events recorded, by type', ('type',))
+
+# RouterControl
+ROUTER_COMMAND_SECONDS = Histogram(REGISTRY, 'kidcontrol_router_command_seconds',
+                                   'Latency of SSH commands on the router, by command', ('command',))
+ROUTER_COMMAND_ERRORS = Counter(REGISTRY, 'kidcontrol_router_command_errors_total',
+                                'Router commands that failed or returned non-zero, by command', ('command',))
+ROUTER_TOGGLES = Counter(REGISTRY, 'kidcontrol_router_toggles_total',
+                         'Restrict changes, by outcome (applied, unchanged, dry_run, failed)', ('outcome',))
+ROUTER_CIRCUIT_STATE = Gauge(REGISTRY, 'kidcontrol_router_circuit_state',
+                             'State of the router circuit breaker (0 closed, 1 half open: one trial command, 2 open: commands refused)')
+ROUTER_RECONCILES = Counter(REGISTRY, 'kidcontrol_router_reconciles_total',
+                            'Attempts to bring the router back to the desired restrict state, by outcome', ('outcome',))
+
+# TimeControl
+TICK_SECONDS = Histogram(REGISTRY, 'kidcontrol_tick_seconds', 'Duration of an enforcement check of every profile')
+TICK_LAG_SECONDS = Histogram(REGISTRY, 'kidcontrol_tick_lag_seconds',
+                             'How late an enforcement check ran after its deadline',
+                             buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+DECISIONS = Counter(REGISTRY, 'kidcontrol_decisions_total',
+                    'Policy decisions at enforcement checks, by profile and reason (ok, idle or the force-stop reason)',
+                    ('profile', 'reason'))
+FORCE_STOPS = Counter(REGISTRY, 'kidcontrol_force_stops_total', 'Sessions stopped by the enforcer, by profile and reason',
+                      ('profile', 'reason'))
+NETWORK_CHECKS = Counter(REGISTRY, 'kidcontrol_network_checks_total', 'Network probe rounds, by result', ('result',))
+NETWORK_HEALTHY = Gauge(REGISTRY, 'kidcontrol_network_healthy', 'Network health verdict (1 healthy or unknown, 0 unhealthy)')
+
+# Flask
+HTTP_REQUESTS = Counter(REGISTRY, 'kidcontrol_http_requests_total', 'HTTP requests, by endpoint and status',
+                        ('endpoint', 'status'))
+HTTP_REQUEST_SECONDS = Histogram(REGISTRY, 'kidcontrol_http_request_seconds', 'HTTP request duration, by endpoint',
+                                 ('endpoint',))
+SSE_CLIENTS = Gauge(REGISTRY, 'kidcontrol_sse_clients', 'Connected /events clients')
@@ -0,0 +1,166 @@
+import errno
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import setup_logger, log_fields
+from leader import is_leader
+from metrics import NETWORK_CHECKS, NETWORK_HEALTHY
+
+# Get logger
+logger = setup_logger('TIME.CONTROL')
+
+HEALTHY = 'healthy'
+UNHEALTHY = 'unhealthy'
+UNKNOWN = 'unknown'
+
+# A refused or reset connection still proves the host answered
+_REACHABLE_ERRNOS = (errno.ECONNREFUSED, errno.ECONNRESET)
+
+def probe(host, port, timeout):
+    """TCP-connect to host:port; return True if the host answered within timeout."""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError as e:
+        return e.errno in _REACHABLE_ERRNOS
+
+class NetworkHealthMonitor:
+    """Probes the network in the background and keeps a verdict callers can read without waiting.
+
+    Every interval seconds all targets are TCP-probed concurrently with a strict timeout;
+    a round passes if any target answers. port is used for targets given without one and
+    must be a port the targets serve (53 for a resolver or a router running dnsmasq). The verdict only turns unhealthy after
+    fail_threshold failed rounds in a row and back to healthy after recover_threshold
+    passed rounds, so a single lost probe changes nothing. While unhealthy the restart
+    command runs at most every restart_backoff seconds, doubling up to restart_backoff_max.
+    """
+    def __init__(self, targets, port, interval=10, timeout=1.0, fail_threshold=3, recover_threshold=2,
+                 restart_command=None, restart_backoff=60, restart_backoff_max=900):
+        self.targets = [self._parse_target(target, port) for target in targets]
+        self.interval = interval
+        self.timeout = timeout
+        self.fail_threshold = max(1, int(fail_threshold))
+        self.recover_threshold = max(1, int(recover_threshold))
+        self.restart_command = restart_command
+        self.restart_backoff = restart_backoff
+        self.restart_backoff_max = restart_backoff_max
+        self.lock = threading.Lock()
+        self.state = UNKNOWN
+        self.failures = 0
+        self.successes = 0
+        self.last_probe = None
+        self.last_change = None
+        self.next_restart = 0.0
+        self.backoff = restart_backoff
+        self.restarts = 0
+        self.probes = ThreadPoolExecutor(max_workers=max(1, len(self.targets)), thread_name_prefix='netprobe')
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @staticmethod
+    def _parse_target(target, port):
+        host, _, target_port = str(target).partition(':')
+        return host, int(target_port or port)
+
+    def start(self):
+        """Start the probe thread if it isn't running."""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True, name='network-health')
+            self.thread.start()
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def healthy(self):
+        """Return the current verdict; an unknown state (no probe finished yet) counts as healthy."""
+        with self.lock:
+            return self.state != UNHEALTHY
+
+    def status(self):
+        with self.lock:
+            return {'state': self.state, 'failures': self.failures, 'successes': self.successes,
+                    'last_probe': self.last_probe, 'last_change': self.last_change, 'restarts': self.restarts}
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error probing the network: {str(e)}")
+            self.stop_event.wait(self.interval)
+
+    def check(self):
+        """Run one probe round and update the verdict. Returns whether the round passed."""
+        futures = [self.probes.submit(probe, host, port, self.timeout) for host, port in self.targets]
+        passed = any(future.result() for future in futures)
+        NETWORK_CHECKS.inc(result='ok' if passed else 'fail')
+        now = time.time()
+        restart = False
+        with self.lock:
+            self.last_probe = now
+            previous = self.state
+            if passed:
+                self.successes += 1
+                self.failures = 0
+                if self.state != HEALTHY and (self.state == UNKNOWN or self.successes >= self.recover_threshold):
+                    self.state = HEALTHY
+                    self.backoff = self.restart_backoff
+                    self.next_restart = 0.0
+            else:
+                self.failures += 1
+                self.successes = 0
+                if self.state != UNHEALTHY and self.failures >= self.fail_threshold:
+                    self.state = UNHEALTHY
+            if self.state != previous:
+                self.last_change = now
+            if (not passed and self.state == UNHEALTHY and self.restart_command and now >= self.next_restart
+                    and is_leader()):
+                restart = True
+                self.restarts += 1
+                self.next_restart = now + self.backoff
+                self.backoff = min(self.backoff * 2, self.restart_backoff_max)
+            state = self.state
+            failures = self.failures
+        NETWORK_HEALTHY.set(0 if state == UNHEALTHY else 1)
+        if state != previous:
+            logger.info(f"[Network] {previous} -> {state}", extra=log_fields(state=state, failures=failures))
+        if restart:
+            self._restart()
+        return passed
+
+    def _restart(self):
+        logger.info("[Network Failure] Restarting networking service.")
+        try:
+            subprocess.run(self.restart_command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=120)
+        except Exception as e:
+            logger.error(f"Error restarting networking: {str(e)}")
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+def get_network_monitor(config):
+    """Return the shared monitor configured from config.config, starting it on first use."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            options = config.config
+            _monitor = NetworkHealthMonitor(
+                options.get('network_check_targets') or [options['network_check_ip']],
+                port=options['network_check_port'],
+                interval=options.get('network_check_interval', 10),
+                timeout=options.get('network_check_timeout', 1.0),
+                fail_threshold=options.get('network_fail_threshold', 3),
+                recover_threshold=options.get('network_recover_threshold', 2),
+                restart_command=options.get('network_restart_command'),
+                restart_backoff=options.get('network_restart_backoff', 60),
+                restart_backoff_max=options.get('network_restart_backoff_max', 900),
+            )
+            _monitor.start()
+        return _monitor
@@ -0,0 +1,186 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+# Reasons a session may not (continue to) run
+REASON_QUOTA = 'quota'
+REASON_REST = 'rest'
+REASON_TOO_LATE = 'too_late'
+REASON_TOO_EARLY = 'too_early'
+
+def time_to_minutes(time_str):
+    hours, minutes = map(int, time_str.split(':'))
+    return hours * 60 + minutes
+
+def minutes_to_timestamp(day, minutes):
+    """Return the epoch timestamp of a minute-of-day on a given date (local time)."""
+    return (datetime.combine(day, datetime.min.time()) + timedelta(minutes=minutes)).timestamp()
+
+def _int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+@dataclass(frozen=True)
+class UsageState:
+    """Immutable snapshot of everything the policy needs, taken from one read of data.json."""
+    period: int = 0
+    restime: int = 0
+    starting: int = 0
+    ending: int = 24 * 60
+    quotas: Dict[str, int] = field(default_factory=dict)
+    used: int = 0
+    start_time: int = 0
+    stop_time: int = 0
+    elapsed_time: int = 0
+    rest_time: int = 0
+    current_day: str = ''
+
+    @classmethod
+    def from_document(cls, data):
+        settings = data.get('settings', {})
+        records = data.get('time_records', {})
+        return cls(
+            period=_int(settings.get('period')),
+            restime=_int(settings.get('restime')),
+            starting=time_to_minutes(str(settings.get('starting', '0:00'))),
+            ending=time_to_minutes(str(settings.get('ending', '24:00'))),
+            quotas={day: _int(settings.get(day)) for day in WEEKDAYS},
+            used=_int(settings.get('current')),
+            start_time=_int(records.get('start_time')),
+            stop_time=_int(records.get('stop_time')),
+            elapsed_time=_int(records.get('elapsed_time')),
+            rest_time=_int(records.get('rest_time')),
+            current_day=data.get('current_day', ''),
+        )
+
+    @property
+    def running(self):
+        return self.start_time != 0
+
+    @property
+    def rest_per_period(self):
+        """Minutes of rest owed for one full period of use."""
+        return self.period * self.restime // 100
+
+@dataclass(frozen=True)
+class Decision:
+    """Result of evaluating a UsageState at a point in time.
+
+    allowed means "may keep running" while counting and "may start" while stopped; reason
+    and message explain a refusal. time_to_stop/time_to_start are the countdowns shown on
+    the dashboard, rest_time_at_start is the rest_time to record if counting starts now.
+    """
+    running: bool
+    allowed: bool
+    reason: Optional[str]
+    message: Optional[str]
+    max_minutes: int
+    used_minutes: int
+    remaining_minutes: int
+    elapsed_minutes: int
+    required_rest_minutes: int
+    time_to_stop: int
+    time_to_start: int
+    rest_time_at_start: int
+    next_deadline: float
+
+def _rest_at_start(state, now):
+    """Rest time to record when counting starts: credit the rest taken since the last stop,
+    first up to what is required, then up to the proportional maximum for the time used."""
+    if not state.stop_time:
+        return state.rest_time
+    rest = int(now - state.stop_time) // 60
+    stop_times = state.elapsed_time // state.period if state.period > 0 else 0
+    required = (state.period * state.restime * stop_times) // 100
+    saved_rest = min(rest + state.rest_time, required)
+    this_time_required = required - saved_rest
+    max_rest = (state.elapsed_time * state.restime) // 100 if state.period > 0 else 0
+    if this_time_required > 0:
+        add_rest = min(rest, this_time_required)
+    elif state.elapsed_time > 0:
+        add_rest = min(rest, max(0, max_rest - saved_rest))
+    else:
+        add_rest = 0
+    return saved_rest + add_rest
+
+def evaluate(state, now):
+    """Evaluate the policy for a UsageState at epoch time `now`. Pure and side-effect free."""
+    moment = datetime.fromtimestamp(now)
+    today = moment.date()
+    now_mins = moment.hour * 60 + moment.minute
+    max_minutes = state.quotas.get(moment.strftime('%a').lower(), 0)
+    remaining = max_minutes - state.used
+    deadlines = [minutes_to_timestamp(today + timedelta(days=1), 0)]
+
+    since = state.start_time or state.stop_time
+    elapsed = int(now - since) // 60
+
+    allowed, reason, message = True, None, None
+
+    # Dashboard countdowns: minutes until a stop is due, and minutes of rest still owed
+    saved_stop_times = state.elapsed_time // state.period if state.period > 0 else 0
+    owed_rest = (state.period * state.restime * saved_stop_times) // 100
+    time_to_stop = min(remaining, state.rest_per_period - elapsed)
+    time_to_start = owed_rest - state.rest_time - elapsed
+
+    if state.running:
+        stop_times = elapsed // state.period if state.period > 0 else 0
+        required_rest = (state.period * state.restime * stop_times) // 100
+        if state.used + elapsed >= max_minutes:
+            allowed, reason = False, REASON_QUOTA
+            message = f"Elapsed: {elapsed} + Used: {state.used} > Max : {max_minutes}"
+        elif required_rest > state.rest_time:
+            allowed, reason = False, REASON_REST
+            message = f"{required_rest} > {state.rest_time}"
+        elif now_mins >= state.ending:
+            allowed, reason = False, REASON_TOO_LATE
+            message = f"Current Hour: {now_mins} >= End Hour: {state.ending}"
+        elif now_mins < state.starting:
+            allowed, reason = False, REASON_TOO_EARLY
+            message = f"Current Hour: {now_mins} < Start Hour: {state.starting}"
+
+        # Quota exhausted
+        deadlines.append(state.start_time + max(0, remaining) * 60)
+        # First full period after which the required rest exceeds the rest already taken
+        if state.period > 0 and state.restime > 0:
+            periods = 1
+            while (state.period * state.restime * periods) // 100 <= state.rest_time:
+                periods += 1
+            deadlines.append(state.start_time + periods * state.period * 60)
+        # Outside the allowed hours
+        if allowed:
+            deadlines.append(minutes_to_timestamp(today, state.ending))
+        else:
+            deadlines.append(now)
+    else:
+        required_rest = owed_rest
+        if now_mins < state.starting or now_mins >= state.ending:
+            allowed, reason = False, REASON_TOO_EARLY if now_mins < state.starting else REASON_TOO_LATE
+            message = (f"Current time ({moment.strftime('%H:%M')}) is outside allowed hours "
+                       f"({state.starting // 60}:{state.starting % 60:02d} - {state.ending // 60}:{state.ending % 60:02d})")
+        elif state.used >= max_minutes:
+            allowed, reason = False, REASON_QUOTA
+            message = f"Total minutes used today ({state.used}) exceeds maximum allowed ({max_minutes})"
+        elif state.stop_time and state.rest_time + elapsed < required_rest:
+            allowed, reason = False, REASON_REST
+            message = f"Not enough rest time: {state.rest_time + elapsed} minutes taken, {required_rest} minutes required"
+
+    return Decision(
+        running=state.running,
+        allowed=allowed,
+        reason=reason,
+        message=message,
+        max_minutes=max_minutes,
+        used_minutes=state.used,
+        remaining_minutes=remaining,
+        elapsed_minutes=elapsed,
+        required_rest_minutes=required_rest,
+        time_to_stop=time_to_stop,
+        time_to_start=time_to_start,
+        rest_time_at_start=_rest_at_start(state, now),
+        next_deadline=min(deadlines),
+    )
@@ -1,86 +1,662 @@
-import requests
-import json
-from config import Config, setup_logger
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import Config, setup_logger, log_fields
+from ssh_pool import get_session_pool, TIMEOUT_EXIT
+from fake_router import get_fake_router
+from router_snapshot import SNAPSHOT_COMMAND, parse_snapshot, deauth_command, parse_deauth_output
+from device_inventory import DeviceInventory
+from command_queue import CommandQueue
+from circuit_breaker import CircuitBreaker, RouterUnavailable, OPEN, HALF_OPEN, CLOSED
+from leader import is_leader
+from metrics import ROUTER_COMMAND_SECONDS, ROUTER_COMMAND_ERRORS, ROUTER_TOGGLES, ROUTER_CIRCUIT_STATE, ROUTER_RECONCILES
 
 # Get logger
 logger = setup_logger('ROUTER.CONTROL')
 
-class RouterControl:
+class _StatusCache:
+    """Last known firewall status per tag, shared by every RouterControl talking to the same router."""
     def __init__(self):
-        self.config = Config()
+        self.lock = threading.Lock()
+        self.statuses = {}
+        self.updated_at = {}
+        self.snapshot = None
+        self.controls = {}
+        # Restrict state per tag as last requested; statuses above hold what the router confirmed
+        self.desired = {}
+        self.toggle_stats = {}
+        # Reconnects run one at a time on a single worker; requests made while one is queued are merged into it
+        self.reconnect_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reconnect')
+        self.deauth_workers = None
+        self.reconnect_pending = None
+        self.last_reconnect = []
+        # Status checks and toggles go through one serialized queue, so uci changes never overlap
+        self.commands = CommandQueue()
+        self.refresher = None
+        self.stop_event = threading.Event()
+        # Fails router commands fast while the router is unreachable
+        self.breaker = None
+        # Re-applies the desired state after failures; woken early when the router comes back
+        self.reconciler = None
+        self.reconcile_event = threading.Event()
+        self.reconcile_stop = threading.Event()
+        # In a worker that isn't the leader, restrict changes wait here for the leader to apply them
+        self.forwarder = ThreadPoolExecutor(max_workers=4, thread_name_prefix='forward')
+
+_status_caches = {}
+_status_caches_lock = threading.Lock()
+
+def _get_status_cache(host):
+    with _status_caches_lock:
+        cache = _status_caches.get(host)
+        if cache is None:
+            cache = _StatusCache()
+            _status_caches[host] = cache
+        return cache
+
+class RouterControl:
+    def __init__(self, profile=None, config=None):
+        self.config = config or Config(profile)
         self.openwrt_ip = self.config.config.get('openwrt_ip')
         self.openwrt_user = self.config.config.get('openwrt_user')
         self.openwrt_password = self.config.config.get('password')
+        if self.config.config.get('router_backend', 'ssh') == 'fake':
+            tags = [Config(name).profile_tag() for name in self.config.profile_names()]
+            self.ssh = get_fake_router(self.openwrt_ip, tags=tags, **self.config.config.get('fake_router', {}))
+        else:
+            self.ssh = get_session_pool(
+                self.openwrt_ip,
+                self.openwrt_user,
+                self.openwrt_password,
+                pool_size=self.config.config.get('ssh_pool_size', 2),
+                keepalive=self.config.config.get('ssh_keepalive', 15),
+                persist=self.config.config.get('ssh_persist', 600),
+                connect_timeout=self.config.config.get('ssh_connect_timeout', 5),
+            )
+        self.timeouts = self.config.config.get('router_timeouts', {})
+        self.status_ttl = self.config.config.get('status_ttl', 30)
+        self.status_stale_ttl = self.config.config.get('status_stale_ttl', 300)
+        self.status_cache = _get_status_cache(self.openwrt_ip)
+        with self.status_cache.lock:
+            if self.status_cache.deauth_workers is None:
+                # Interfaces are deauthenticated in parallel, at most one per pooled SSH session
+                self.status_cache.deauth_workers = ThreadPoolExecutor(
+                    max_workers=max(1, self.config.config.get('ssh_pool_size', 2)), thread_name_prefix='deauth')
+            if self.status_cache.breaker is None:
+                self.status_cache.breaker = CircuitBreaker(
+                    failure_threshold=self.config.config.get('router_breaker_failures', 3),
+                    reset_timeout=self.config.config.get('router_breaker_reset', 30),
+                    on_change=self._on_circuit_change)
+        self.device_tag = self.config.profile_tag()
+        # One registered control per tag; every snapshot updates the status and inventory of all of them
+        with self.status_cache.lock:
+            registered = self.status_cache.controls.get(self.device_tag)
+            if registered is None:
+                self.inventory = DeviceInventory(self.config, self.device_tag)
+                self.status_cache.controls[self.device_tag] = self
+            else:
+                self.inventory = registered.inventory
+        # Pick up a restrict change that was requested but maybe never applied before a restart
+        desired = self.config.get_desired_restrict()
+        if desired is not None:
+            with self.status_cache.lock:
+                self.status_cache.desired.setdefault(self.device_tag, desired)
+
+    def run_command(self, command, label=None, retry=False):
+        """Run a command on OpenWRT over the pooled SSH session, within the label's deadline.
+
+        retry=True reconnects and runs the command again if the session dropped; only for
+        read-only commands. Raises RouterUnavailable without trying while the circuit breaker is open.
+        """
+        label = label or command.split()[0]
+        breaker = self.status_cache.breaker
+        if not breaker.allow():
+            raise RouterUnavailable(f"router {self.openwrt_ip} is unreachable, not running {label}")
+        start = time.monotonic()
+        try:
+            result = self.ssh.run(command, label=label, timeout=self.timeouts.get(label, self.timeouts.get('default')),
+                                  retry=retry)
+        except Exception:
+            ROUTER_COMMAND_ERRORS.inc(command=label)
+            breaker.record_failure()
+            raise
+        finally:
+            ROUTER_COMMAND_SECONDS.observe(time.monotonic() - start, command=label)
+        if result.returncode in (255, TIMEOUT_EXIT):
+            # ssh could not reach the router, or the command hung
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if result.returncode != 0:
+            ROUTER_COMMAND_ERRORS.inc(command=label)
+        return result
+
+    def _on_circuit_change(self, previous, state):
+        ROUTER_CIRCUIT_STATE.set({CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[state])
+        if state == OPEN:
+            logger.error(f"Router {self.openwrt_ip} unreachable, failing router commands fast for a while")
+        elif state == CLOSED:
+            logger.info(f"Router {self.openwrt_ip} reachable again")
+            # Converge right away instead of at the next reconcile interval
+            self.status_cache.reconcile_event.set()
+
+    def circuit_stats(self):
+        """Return the circuit breaker state, consecutive failures and refused calls."""
+        return self.status_cache.breaker.stats()
+
+    def latency_stats(self):
+        """Return per-command SSH latency counters."""
+        return self.ssh.latency_stats()
 
     def check_firewall_status(self):
-        """Check restrict status by running check_restrict_status.sh on OpenWRT via SSH."""
-        openwrt_ip = self.openwrt_ip
-        openwrt_user = self.openwrt_user
-        openwrt_password = self.openwrt_password
+        """Return the restrict status from the cache, refreshing it from the router when needed.
+
+        Within status_ttl the cached value is returned as is. Up to status_stale_ttl the
+        stale value is returned immediately and a refresh is queued in the background.
+        Older or missing values are fetched synchronously. A worker that isn't the leader
+        reads the status the leader last saved in the document instead.
+        """
+        if not is_leader():
+            return self._document_status()
+        cache = self.status_cache
+        with cache.lock:
+            status = cache.statuses.get(self.device_tag)
+            age = time.monotonic() - cache.updated_at.get(self.device_tag, 0.0)
+            if status is not None and age < self.status_ttl:
+                return status
+        if status is not None and age < self.status_stale_ttl:
+            self.request_refresh()
+            return status
+        return self.refresh_firewall_status()
+
+    def _document_status(self):
+        status = self.config.get_network_status()
+        return status if status in ('enabled', 'disabled') else None
+
+    def _set_cached_status(self, network_status):
+        cache = self.status_cache
+        with cache.lock:
+            cache.statuses[self.device_tag] = network_status
+            cache.updated_at[self.device_tag] = time.monotonic()
+            control = cache.controls.get(self.device_tag, self)
+        control.config.set_network_status(network_status)
+
+    def start_status_refresher(self, interval=None):
+        """Keep the status cache warm from a background thread."""
+        cache = self.status_cache
+        interval = interval or max(1, self.status_ttl * 0.8)
+        with cache.lock:
+            if cache.refresher is not None and cache.refresher.is_alive():
+                return
+            cache.stop_event.clear()
+
+            def refresh_loop():
+                while not cache.stop_event.is_set():
+                    self.refresh_firewall_status()
+                    cache.stop_event.wait(interval)
+
+            cache.refresher = threading.Thread(target=refresh_loop, daemon=True)
+            cache.refresher.start()
+
+    def stop_status_refresher(self):
+        """Stop the background status refresher."""
+        self.status_cache.stop_event.set()
 
+    def fetch_snapshot(self):
+        """Read the dhcp host table and every interface's association list in one SSH exec."""
         try:
-            ssh_cmd = f"sshpass -p '{openwrt_password}' ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null {openwrt_user}@{openwrt_ip} '/etc/config/scripts/check_restrict_status.sh'"
-            import subprocess
-            result = subprocess.run(ssh_cmd, shell=True, capture_output=True, text=True)
-            if result.returncode == 0:
-                network_status = "enabled"
-                logger.info(f"check_restrict_status.sh executed on OpenWRT: {result.stdout}")
-            elif result.returncode == 1:
-                network_status = "disabled"
-                logger.info(f"check_restrict_status.sh executed on OpenWRT: {result.stdout}")
-            else:
-                logger.error(f"check_restrict_status.sh returned unexpected code: {result.returncode}, stderr: {result.stderr}")
+            result = self.run_command(SNAPSHOT_COMMAND, label='snapshot', retry=True)
+            if 'dhcp.' not in result.stdout:
+                logger.error(f"Router snapshot failed: code {result.returncode}, stderr: {result.stderr}")
                 return None
-            self.config.set_network_status(network_status)
-            return network_status
+            snapshot = parse_snapshot(result.stdout)
+            with self.status_cache.lock:
+                self.status_cache.snapshot = snapshot
+                controls = list(self.status_cache.controls.values())
+            for control in controls:
+                control.inventory.update(snapshot)
+            return snapshot
+        except RouterUnavailable:
+            return None
         except Exception as e:
-            logger.error(f"Error checking restrict status via OpenWRT SSH: {str(e)}")
+            logger.error(f"Error fetching router snapshot via OpenWRT SSH: {str(e)}")
+            return None
+
+    def get_devices_under_max(self):
+        """Return the tagged devices from the in-memory inventory.
+
+        An inventory older than status_ttl is returned as is while a refresh runs in the
+        background, like check_firewall_status(); only an empty, never refreshed one waits for the router.
+        """
+        if not is_leader():
+            # The leader keeps the saved inventory up to date
+            self.inventory.reload()
+            return self.inventory.list()
+        if time.monotonic() - self.inventory.updated_at >= self.status_ttl:
+            refresh = self.request_refresh()
+            if not self.inventory.updated_at and not self.inventory.devices:
+                refresh.result()
+        return self.inventory.list()
+
+    def _controls(self):
+        with self.status_cache.lock:
+            return dict(self.status_cache.controls)
+
+    def request_refresh(self):
+        """Queue a status refresh of every profile and return a Future of this profile's status.
+
+        Refreshes requested while one is already queued share it.
+        """
+        if not is_leader():
+            future = Future()
+            future.set_result(self._document_status())
+            return future
+        return self.status_cache.commands.submit(
+            'status', self._refresh_all, self.device_tag,
+            resolve=lambda snapshot, merged, tag: snapshot.network_status(tag) if snapshot else None,
+        )
+
+    def refresh_firewall_status(self):
+        """Check restrict status of the devices of every profile from one fresh router snapshot."""
+        return self.request_refresh().result()
+
+    def _refresh_all(self, _tag=None):
+        snapshot = self.fetch_snapshot()
+        if snapshot is None:
             return None
-  
+        for tag, control in self._controls().items():
+            network_status = snapshot.network_status(tag)
+            if network_status is None:
+                logger.error(f"No devices found with the {tag} tag")
+                continue
+            logger.info(f"Restrict status of {len(snapshot.tagged(tag))} {tag} devices: network {network_status}",
+                        extra=log_fields(key=f'status.{tag}', state=network_status, tag=tag, network=network_status))
+            control._set_cached_status(network_status)
+        return snapshot
+
     def update_rule_status(self, disabled):
-        """Update the status of the KidControl rule by calling a shell script on OpenWRT via SSH."""
-        openwrt_ip = self.openwrt_ip
-        openwrt_user = self.openwrt_user
-        openwrt_password = self.openwrt_password
+        """Add (disabled=False) or remove (disabled=True) the restrict tag on the tagged devices."""
+        return self.apply_restrictions({self.device_tag: not disabled}).get(self.device_tag, False)
+
+    def _confirmed_restrict(self, tag):
+        """Return the restrict state of a tag last confirmed by the router, or None if unknown or older than status_ttl."""
+        cache = self.status_cache
+        with cache.lock:
+            status = cache.statuses.get(tag)
+            if status is None or time.monotonic() - cache.updated_at.get(tag, 0.0) >= self.status_ttl:
+                return None
+            return status == 'disabled'
+
+    def _reached(self, tag, restricted, dry_run):
+        """Record a state the router reached for a request as desired, before it is confirmed.
+
+        Done on the command queue ahead of the confirmation, so the reconcile loop never
+        sees an unrestricted router while the desired state still says restricted.
+        """
+        if not restricted and not dry_run:
+            self._set_desired({tag: False})
+
+    def _confirm(self, tag, restricted):
+        control = self._controls().get(tag)
+        if control is not None:
+            control._set_cached_status('disabled' if restricted else 'enabled')
+
+    def _count(self, **increments):
+        cache = self.status_cache
+        with cache.lock:
+            for name, value in increments.items():
+                cache.toggle_stats[name] = cache.toggle_stats.get(name, 0) + value
+
+    def toggle_stats(self):
+        """Return the toggle counters: router writes, reloads and reconnects done and avoided."""
+        with self.status_cache.lock:
+            return dict(self.status_cache.toggle_stats)
+
+    def plan_restrictions(self, restrictions, snapshot=None):
+        """Dry run: return {tag: [uci commands]} for the tags whose restrict state would change."""
+        snapshot = snapshot or self.fetch_snapshot()
+        if snapshot is None:
+            return None
+        return {tag: snapshot.toggle_commands(tag, restrict=restrict)
+                for tag, restrict in restrictions.items()
+                if snapshot.tagged(tag) and snapshot.toggle_commands(tag, restrict=restrict)}
+
+    def apply_restrictions(self, restrictions, dry_run=None, record=True):
+        """Add or remove the restrict tag for several tags at once and wait for the result.
+
+        See submit_restrictions(). Returns {tag: applied}.
+        """
+        return self.submit_restrictions(restrictions, dry_run, record).result()
+
+    def submit_restrictions(self, restrictions, dry_run=None, record=True):
+        """Queue a restrict change, e.g. {'MAX': True, 'LILY': False}, and return a Future of {tag: applied}.
+
+        A change queued behind another one is merged into it, the later value of a tag
+        winning; a caller whose value was superseded gets False for that tag.
+
+        A restrict (a stop) is saved as the desired state before the router is touched, so
+        it is retried until it sticks. An unrestrict (a start) only becomes the desired state
+        once the router applied it: a start that failed must not open the network later,
+        when no session is counting. record=False leaves the desired state alone (the reconcile loop).
+        """
+        dry_run = self.config.config.get('router_dry_run', False) if dry_run is None else dry_run
+        record = record and not dry_run
+        if not is_leader():
+            versions = self._set_desired(restrictions) if record else {}
+            return self.status_cache.forwarder.submit(self._wait_for_leader, dict(restrictions), versions, dry_run)
+        if record:
+            self._set_desired({tag: True for tag, restrict in restrictions.items() if restrict})
+        future = self.status_cache.commands.submit(
+            ('toggle', dry_run), lambda merged: self._apply_restrictions(merged, dry_run), dict(restrictions),
+            merge=self._merge_restrictions,
+            resolve=lambda results, merged, own: {tag: bool(results.get(tag)) and merged[tag] == own[tag] for tag in own},
+        )
+        if record:
+            future.add_done_callback(lambda done: self._restore_restricted(restrictions, done))
+        return future
+
+    def _restore_restricted(self, restrictions, done):
+        """Make the tags of a failed or superseded unrestrict desired restricted again."""
+        results = done.result() if not done.cancelled() and done.exception() is None else {}
+        failed = {tag: True for tag, restrict in restrictions.items() if not restrict and not results.get(tag)}
+        if failed:
+            self._set_desired(failed)
+
+    @staticmethod
+    def _merge_restrictions(queued, later):
+        for tag, restrict in later.items():
+            if tag in queued and queued[tag] != restrict:
+                logger.info(f"Restrict {'on' if queued[tag] else 'off'} for {tag} superseded before it ran")
+        return dict(queued, **later)
+
+    def _apply_restrictions(self, restrictions, dry_run):
+        """Add or remove the restrict tag for several tags at once, on the command queue.
+
+        Tags whose confirmed state already matches are skipped without touching the router;
+        the rest are diffed against one snapshot and only real changes are written, in one
+        exec with a single `uci commit` and dnsmasq reload. With dry_run (or router_dry_run
+        in the config) nothing is written; with router_verify the result is read back from
+        the router before it counts as applied. Returns {tag: applied}.
+        """
+        results = {tag: False for tag in restrictions}
+        self._count(requests=1)
 
-        action = 'on' if not disabled else 'off'
+        pending = {}
+        for tag, restrict in restrictions.items():
+            if self._confirmed_restrict(tag) == restrict:
+                self._reached(tag, restrict, dry_run)
+                results[tag] = True
+            else:
+                pending[tag] = restrict
+        if not pending:
+            self._count(reloads_avoided=1, reconnects_avoided=1)
+            ROUTER_TOGGLES.inc(outcome='unchanged')
+            return results
+
+        snapshot = self.fetch_snapshot()
+        if snapshot is None:
+            return results
+        commands = []
+        applied = []
+        for tag, restrict in pending.items():
+            if not snapshot.tagged(tag):
+                logger.error(f"No devices found with the {tag} tag, restrict {'on' if restrict else 'off'} not applied")
+                continue
+            tag_commands = snapshot.toggle_commands(tag, restrict=restrict)
+            if tag_commands:
+                commands += tag_commands
+                applied.append(tag)
+            else:
+                # Already in the desired state on the router
+                self._reached(tag, restrict, dry_run)
+                self._confirm(tag, restrict)
+                results[tag] = True
+        if not applied:
+            self._count(reloads_avoided=1, reconnects_avoided=1)
+            ROUTER_TOGGLES.inc(outcome='unchanged')
+            return results
+
+        summary = ', '.join(f"{tag} {'on' if pending[tag] else 'off'}" for tag in applied)
+        if dry_run:
+            logger.info(f"[DRY RUN] restrict {summary}: {' && '.join(commands)}")
+            self._count(reloads_avoided=1, reconnects_avoided=1)
+            ROUTER_TOGGLES.inc(outcome='dry_run')
+            return results
+
+        changes = len(commands)
+        commands += ['uci commit dhcp', '/etc/init.d/dnsmasq reload']
         try:
-            ssh_cmd = f"sshpass -p '{openwrt_password}' ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null {openwrt_user}@{openwrt_ip} '/etc/config/scripts/toggle_restrict.sh {action}'"
-            import subprocess
-            result = subprocess.run(ssh_cmd, shell=True, capture_output=True, text=True)
+            result = self.run_command(' && '.join(commands), label='toggle')
+            self._count(router_writes=1, reloads=1)
             if result.returncode != 0:
-                logger.error(f"Failed to run toggle_restrict.sh {action} on OpenWRT: {result.stderr}")
-                return False
-            logger.info(f"toggle_restrict.sh {action} executed on OpenWRT: {result.stdout}")
-            # Optionally, reconnect devices if needed
-            self.reconnect_all_devices()
-            return True
+                logger.error(f"Failed to apply restrict {summary} on OpenWRT: {result.stderr}")
+                ROUTER_TOGGLES.inc(outcome='failed')
+                return results
+            logger.info(f"Restrict {summary} applied on OpenWRT with {changes} tag changes")
+            verified = self.fetch_snapshot() if self.config.config.get('router_verify', False) else None
+            for tag in applied:
+                if verified is not None and verified.restrict_state(tag) != pending[tag]:
+                    logger.error(f"Restrict {'on' if pending[tag] else 'off'} for {tag} not confirmed by the router")
+                    self._count(verify_failures=1)
+                    continue
+                self._reached(tag, pending[tag], dry_run)
+                self._confirm(tag, pending[tag])
+                results[tag] = True
+            # Kick the affected devices so they pick up the new rules
+            self.reconnect_all_devices(snapshot, tags=applied)
+            self._count(reconnects=1)
+            ROUTER_TOGGLES.inc(outcome='applied')
+            return results
+        except RouterUnavailable as e:
+            logger.error(f"Restrict {summary} not applied, will retry: {str(e)}")
+            ROUTER_TOGGLES.inc(outcome='failed')
+            return results
         except Exception as e:
             logger.error(f"Error updating rule status via OpenWRT SSH: {str(e)}")
-            return False
+            ROUTER_TOGGLES.inc(outcome='failed')
+            return results
+
+    def _wait_for_leader(self, restrictions, versions, dry_run):
+        """In a worker that isn't the leader: wait until the leader applied the requested versions.
+
+        A status saved before the request doesn't count, even if it matches: the leader
+        must have seen the router in the requested state since. A tag whose request was
+        superseded by another worker's gets False right away. An unrestrict the leader
+        didn't apply in time is withdrawn, so it can't open the network later with no
+        session counting.
+        """
+        if dry_run:
+            logger.info(f"[DRY RUN] restrict {restrictions} left to the leader process")
+            return {tag: False for tag in restrictions}
+        controls = self._controls()
+        deadline = time.monotonic() + self.config.config.get('leader_apply_timeout', 15)
+        results = {tag: False for tag in restrictions}
+        pending = {tag: restrict for tag, restrict in restrictions.items() if tag in versions}
+        while pending:
+            for tag, restrict in list(pending.items()):
+                data = controls[tag].config.get_profile_data()
+                if data.get('desired_restrict') == restrict and data.get('applied_version', 0) >= versions[tag]:
+                    results[tag] = True
+                    del pending[tag]
+                elif data.get('desired_restrict') != restrict and data.get('desired_version', 0) > versions[tag]:
+                    del pending[tag]
+            if not pending or time.monotonic() >= deadline:
+                break
+            time.sleep(0.2)
+        for tag, restrict in restrictions.items():
+            if not restrict and not results[tag] and tag in versions:
+                controls[tag].config.set_desired_restrict(True, if_version=versions[tag])
+        return results
+
+    def _set_desired(self, restrictions):
+        """Record the requested restrict states, in memory and in each profile's document.
+
+        Returns {tag: version} of the requests saved in the document.
+        """
+        with self.status_cache.lock:
+            self.status_cache.desired.update(restrictions)
+        controls = self._controls()
+        versions = {}
+        for tag, restrict in restrictions.items():
+            control = controls.get(tag)
+            if control is not None:
+                versions[tag] = control.config.set_desired_restrict(restrict)
+        return versions
+
+    def drift(self):
+        """Return {tag: restrict} for the tags whose router state isn't known to match the desired one."""
+        cache = self.status_cache
+        with cache.lock:
+            desired = dict(cache.desired)
+        # Other worker processes record their requests in the document
+        for tag, control in self._controls().items():
+            restrict = control.config.get_desired_restrict()
+            if restrict is not None:
+                desired[tag] = restrict
+        with cache.lock:
+            return {tag: restrict for tag, restrict in desired.items()
+                    if cache.statuses.get(tag) != ('disabled' if restrict else 'enabled')}
+
+    def _acknowledge_desired(self):
+        """Mark requests another worker made for a state the router is known to be in as applied."""
+        for tag, control in self._controls().items():
+            restricted = self._confirmed_restrict(tag)
+            if restricted is not None:
+                control.config.set_network_status('disabled' if restricted else 'enabled')
+
+    def start_reconciler(self, interval=None):
+        """Re-apply the desired restrict states in the background until the router matches them.
+
+        Drift is checked every reconcile_interval seconds; after a failed attempt the wait
+        doubles up to reconcile_backoff_max, and resets once an attempt succeeds.
+        """
+        if self.config.config.get('router_dry_run', False):
+            # Nothing is ever written, so there is nothing to converge
+            return
+        cache = self.status_cache
+        interval = interval or self.config.config.get('reconcile_interval', 15)
+        backoff_max = self.config.config.get('reconcile_backoff_max', 300)
+        with cache.lock:
+            if cache.reconciler is not None and cache.reconciler.is_alive():
+                return
+            cache.reconcile_stop.clear()
+
+            def reconcile_loop():
+                wait = interval
+                while not cache.reconcile_stop.is_set():
+                    cache.reconcile_event.wait(wait)
+                    cache.reconcile_event.clear()
+                    if cache.reconcile_stop.is_set():
+                        return
+                    wait = self._reconcile_once(wait, interval, backoff_max)
+
+            cache.reconciler = threading.Thread(target=reconcile_loop, daemon=True, name='reconcile')
+            cache.reconciler.start()
+
+    def _reconcile_once(self, wait, interval, backoff_max):
+        """Apply the drifted tags once; return how long to wait before the next check."""
+        self._acknowledge_desired()
+        drift = self.drift()
+        if not drift:
+            return interval
+        try:
+            results = self.apply_restrictions(drift, record=False)
+        except Exception as e:
+            logger.error(f"Error reconciling restrict state: {str(e)}")
+            results = {}
+        failed = [tag for tag in drift if not results.get(tag)]
+        if not failed:
+            ROUTER_RECONCILES.inc(outcome='converged')
+            logger.info(f"Router converged to the desired restrict state of {', '.join(sorted(drift))}")
+            return interval
+        ROUTER_RECONCILES.inc(outcome='failed')
+        wait = min(max(wait, interval) * 2, backoff_max)
+        logger.info(f"Restrict state of {', '.join(sorted(failed))} still differs from the router, retrying in {wait}s",
+                    extra=log_fields(key='reconcile', state=','.join(sorted(failed)), retry=wait))
+        return wait
+
+    def stop_reconciler(self):
+        """Stop the background reconcile loop."""
+        self.status_cache.reconcile_stop.set()
+        self.status_cache.reconcile_event.set()
+
+    def wake_reconciler(self):
+        """Check for drift now instead of at the next reconcile interval."""
+        self.status_cache.reconcile_event.set()
     
-    def reconnect_all_devices(self):
-        """Reconnect all devices by calling /root/reconnect.sh all on OpenWRT via SSH in a background thread."""
-        openwrt_ip = self.openwrt_ip
-        openwrt_user = self.openwrt_user
-        openwrt_password = self.openwrt_password
+    def reconnect_all_devices(self, snapshot=None, tags=None):
+        """Deauthenticate the associated devices of the given tags (default: this profile's) in the background.
+
+        Only devices that are associated right now are kicked, with one exec per
+        interface and the interfaces in parallel. Returns a Future of the per-device report.
+        """
+        tags = tags or [self.device_tag]
+        cache = self.status_cache
+        with cache.lock:
+            pending = cache.reconnect_pending
+            if pending is not None:
+                # A reconnect is already queued: fold this one into it
+                pending['tags'].update(tags)
+                pending['snapshot'] = snapshot or pending['snapshot']
+                return pending['future']
+            pending = {'tags': set(tags), 'snapshot': snapshot, 'future': Future()}
+            cache.reconnect_pending = pending
 
         def run_disconnect():
-            disconnect_cmd = '/etc/config/scripts/reconnect.sh all'
-            ssh_cmd = (
-                f"sshpass -p '{openwrt_password}' ssh -o StrictHostKeyChecking=no "
-                f"-o UserKnownHostsFile=/dev/null {openwrt_user}@{openwrt_ip} '{disconnect_cmd}'"
-            )
-            import subprocess
+            with cache.lock:
+                cache.reconnect_pending = None
             try:
-                result = subprocess.run(ssh_cmd, shell=True, capture_output=True, text=True)
-                if result.returncode == 0:
-                    logger.info(f"reconnect.sh all executed successfully: {result.stdout}")
-                else:
-                    logger.error(f"reconnect.sh all failed: {result.stderr}")
+                report = self._deauthenticate(pending['snapshot'], sorted(pending['tags']))
+                pending['future'].set_result(report)
             except Exception as e:
-                logger.error(f"Error running reconnect.sh all: {str(e)}")
+                logger.error(f"Error deauthenticating devices: {str(e)}")
+                pending['future'].set_exception(e)
+
+        cache.reconnect_worker.submit(run_disconnect)
+        return pending['future']
+
+    def _deauthenticate(self, snapshot, tags):
+        current = snapshot or self.fetch_snapshot()
+        if current is None:
+            return []
+        by_iface = {}
+        for tag in tags:
+            for iface, mac, name in current.deauth_targets(tag):
+                by_iface.setdefault(iface, {})[mac] = name
+        if not by_iface:
+            logger.info(f"No {', '.join(tags)} devices associated, nothing to reconnect")
+            return []
+
+        def run_batch(iface, devices):
+            start = time.monotonic()
+            try:
+                result = self.run_command(deauth_command(iface, devices), label='reconnect')
+                outcomes = parse_deauth_output(result.stdout)
+                error = result.stderr.strip()
+            except Exception as e:
+                outcomes, error = {}, str(e)
+            seconds = round(time.monotonic() - start, 3)
+            return [{'iface': iface, 'mac': mac, 'name': name, 'ok': outcomes.get(mac, False),
+                     'seconds': seconds, 'error': '' if outcomes.get(mac) else error or 'deauthenticate refused'}
+                    for mac, name in devices.items()]
+
+        futures = [self.status_cache.deauth_workers.submit(run_batch, iface, devices)
+                   for iface, devices in sorted(by_iface.items())]
+        report = [entry for future in futures for entry in future.result()]
+        for entry in report:
+            if entry['ok']:
+                logger.info(f"Deauthenticated {entry['name']} ({entry['mac']}) on {entry['iface']} in {entry['seconds']}s")
+            else:
+                logger.error(f"Deauthenticate failed for {entry['name']} ({entry['mac']}) on {entry['iface']}: {entry['error']}")
+        with self.status_cache.lock:
+            self.status_cache.last_reconnect = report
+        return report
 
-        import threading
-        threading.Thread(target=run_disconnect, daemon=True).start()
+    def queue_stats(self):
+        """Return the command queue counters (submitted, coalesced, executed, failed, queued)."""
+        return self.status_cache.commands.queue_stats()
 
+    def reconnect_report(self):
+        """Return the per-device outcome and timing of the last reconnect."""
+        with self.status_cache.lock:
+            return list(self.status_cache.last_reconnect)
@@ -0,0 +1,155 @@
+import re
+import shlex
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+
+RESTRICT_TAG = 'restrict'
+IFACE_MARKER = '@@IFACE'
+DEAUTH_MARKER = '@@DEAUTH'
+
+# One round trip: the whole dhcp config, then the association list of every wireless interface
+SNAPSHOT_COMMAND = (
+    "uci show dhcp; "
+    "for iface in $(iw dev 2>/dev/null | awk '/Interface/ {print $2}'); do "
+    f"echo \"{IFACE_MARKER} $iface\"; iwinfo \"$iface\" assoclist 2>/dev/null; "
+    "done"
+)
+
+_MAC_RE = re.compile(r'^([0-9A-Fa-f]{2}(?::[0-9A-Fa-f]{2}){5})\b')
+
+@dataclass(frozen=True)
+class DhcpHost:
+    """A `config host` section of /etc/config/dhcp."""
+    path: str
+    name: str = ''
+    macs: Tuple[str, ...] = ()
+    tags: Tuple[str, ...] = ()
+
+    def has_tag(self, tag):
+        return tag in self.tags
+
+@dataclass(frozen=True)
+class RouterSnapshot:
+    """Everything RouterControl needs to know about the router, taken in a single SSH exec."""
+    hosts: Tuple[DhcpHost, ...] = ()
+    associations: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+    taken_at: float = 0.0
+
+    def tagged(self, tag):
+        """Return the hosts carrying a tag."""
+        return [host for host in self.hosts if host.has_tag(tag)]
+
+    def associated_interfaces(self, mac):
+        """Return the wireless interfaces a MAC is currently associated with."""
+        mac = mac.upper()
+        return [iface for iface, macs in self.associations.items() if mac in macs]
+
+    def restrict_state(self, tag):
+        """True if every host with the tag is restricted, False if any is not, None if there are none."""
+        hosts = self.tagged(tag)
+        if not hosts:
+            return None
+        return all(host.has_tag(RESTRICT_TAG) for host in hosts)
+
+    def network_status(self, tag):
+        """Map restrict_state() to the 'enabled'/'disabled' network status used by the UI."""
+        restricted = self.restrict_state(tag)
+        if restricted is None:
+            return None
+        return 'disabled' if restricted else 'enabled'
+
+    def toggle_commands(self, tag, restrict):
+        """Return the uci commands that add or remove the restrict tag on the hosts with the tag.
+
+        The whole uci argument is quoted so the shell never globs the [N] of a host path.
+        """
+        commands = []
+        for host in self.tagged(tag):
+            option = shlex.quote(f'{host.path}.tag={RESTRICT_TAG}')
+            if restrict and not host.has_tag(RESTRICT_TAG):
+                commands.append(f'uci add_list {option}')
+            elif not restrict and host.has_tag(RESTRICT_TAG):
+                commands.append(f'uci del_list {option}')
+        return commands
+
+    def deauth_targets(self, tag):
+        """Return (interface, mac, name) for every host with the tag that is associated right now."""
+        targets = []
+        for host in self.tagged(tag):
+            for mac in host.macs:
+                for iface in self.associated_interfaces(mac):
+                    targets.append((iface, mac.upper(), host.name))
+        return targets
+
+def deauth_command(iface, macs):
+    """Return one exec that deauthenticates MACs on an interface and reports each outcome."""
+    return '; '.join(
+        f'hostapd_cli -i {iface} deauthenticate {mac} >/dev/null 2>&1 '
+        f'&& echo "{DEAUTH_MARKER} {mac} ok" || echo "{DEAUTH_MARKER} {mac} fail"'
+        for mac in macs
+    )
+
+def parse_deauth_output(output):
+    """Return {mac: True/False} from the output of deauth_command()."""
+    outcomes = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) == 3 and parts[0] == DEAUTH_MARKER:
+            outcomes[parts[1].upper()] = parts[2] == 'ok'
+    return outcomes
+
+def _uci_values(raw):
+    try:
+        return tuple(shlex.split(raw))
+    except ValueError:
+        return (raw.strip("'"),)
+
+def parse_snapshot(output, taken_at=None):
+    """Parse the output of SNAPSHOT_COMMAND into a RouterSnapshot."""
+    sections = {}
+    order = []
+    associations = {}
+    current_iface = None
+
+    for line in output.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(IFACE_MARKER):
+            current_iface = line[len(IFACE_MARKER):].strip()
+            associations.setdefault(current_iface, [])
+            continue
+        if current_iface is not None:
+            match = _MAC_RE.match(line)
+            if match:
+                associations[current_iface].append(match.group(1).upper())
+            continue
+        if not line.startswith('dhcp.') or '=' not in line:
+            continue
+        key, raw = line.split('=', 1)
+        parts = key.split('.')
+        if len(parts) == 2:
+            if raw == 'host':
+                sections[key] = {}
+                order.append(key)
+        elif len(parts) == 3:
+            path = f'{parts[0]}.{parts[1]}'
+            if path in sections:
+                sections[path][parts[2]] = _uci_values(raw)
+
+    hosts = []
+    for path in order:
+        options = sections[path]
+        name = options.get('name', ('',))
+        hosts.append(DhcpHost(
+            path=path,
+            name=name[0] if name else '',
+            macs=tuple(mac.upper() for mac in options.get('mac', ())),
+            tags=options.get('tag', ()),
+        ))
+    return RouterSnapshot(
+        hosts=tuple(hosts),
+        associations={iface: tuple(macs) for iface, macs in associations.items()},
+        taken_at=taken_at if taken_at is not None else time.time(),
+    )
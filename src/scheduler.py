@@ -0,0 +1,85 @@
+import threading
+import time
+from config import setup_logger
+from time_control import time_checking_all, next_deadline_all
+from metrics import TICK_LAG_SECONDS
+
+# Get logger
+logger = setup_logger('KID.CONTROL')
+
+class EnforcementScheduler:
+    """Runs the time checks of every profile exactly when the next deadline is due.
+
+    time_control is one TimeControl or a list of them, one per profile; the profiles
+    that must stop at the same check are restricted in one router update.
+    After each check the scheduler asks for the earliest next deadline and sleeps on a
+    condition variable until then (at most max_sleep seconds). wake() interrupts the sleep,
+    so a start, stop, time adjustment or settings change is enforced immediately. A
+    deadline that is still in the past after a check (e.g. the router refused the stop)
+    is retried every retry_interval seconds.
+    """
+    def __init__(self, time_control, max_sleep=600, grace=0.5, retry_interval=30):
+        self.time_controls = list(time_control) if isinstance(time_control, (list, tuple)) else [time_control]
+        self.max_sleep = max_sleep
+        self.grace = grace
+        self.retry_interval = retry_interval
+        self.condition = threading.Condition()
+        self._woken = False
+        self._stopped = False
+        self._thread = None
+        self._deadline = None
+
+    def start(self):
+        """Start the scheduler thread (no-op if already running)."""
+        with self.condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the scheduler thread and wait for it to exit."""
+        with self.condition:
+            self._stopped = True
+            self.condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self, reason=None):
+        """Re-evaluate the state now instead of at the next deadline."""
+        if reason:
+            logger.info(f"[SCHEDULER] woken: {reason}")
+        with self.condition:
+            self._woken = True
+            self.condition.notify_all()
+
+    def _sleep_seconds(self):
+        self._deadline = None
+        try:
+            deadline = next_deadline_all(self.time_controls)
+        except Exception as e:
+            logger.error(f"Error computing next deadline: {str(e)}")
+            return self.max_sleep
+        self._deadline = deadline
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return min(self.max_sleep, self.retry_interval)
+        return min(self.max_sleep, remaining + self.grace)
+
+    def _run(self):
+        while True:
+            try:
+                time_checking_all(self.time_controls)
+            except Exception as e:
+                logger.error(f"Error in periodic time_checking: {str(e)}")
+            timeout = self._sleep_seconds()
+            with self.condition:
+                if not self._woken and not self._stopped:
+                    self.condition.wait(timeout)
+                # A check that runs because its deadline came due (not a wake) is measured for lag
+                if not self._woken and self._deadline is not None and time.time() >= self._deadline:
+                    TICK_LAG_SECONDS.observe(time.time() - self._deadline)
+                self._woken = False
+                if self._stopped:
+                    return
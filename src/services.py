@@ -0,0 +1,174 @@
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from config import Config, setup_logger
+from time_control import TimeControl
+from scheduler import EnforcementScheduler
+from events import EventPublisher
+from leader import LeaderLease, set_lease, is_leader
+
+# Get logger
+logger = setup_logger('KID.CONTROL')
+
+class Services:
+    """The objects shared by every request, each created on first use.
+
+    Nothing here touches the disk, the router or starts a thread until it is asked for;
+    start_background() starts the enforcement work explicitly and shutdown() stops it.
+    compute_status(profile) builds a profile's dashboard view for the /events publisher.
+    """
+    def __init__(self, compute_status=None):
+        self.compute_status = compute_status
+        self.lock = threading.RLock()
+        self._config = None
+        self._time_controls = None
+        self._scheduler = None
+        self._publisher = None
+        self.lease = None
+        self.started = False
+        self.watch_stop = threading.Event()
+
+    @property
+    def config(self):
+        with self.lock:
+            if self._config is None:
+                self._config = Config()
+            return self._config
+
+    @property
+    def time_controls(self):
+        """One TimeControl per profile, the default profile first."""
+        with self.lock:
+            if self._time_controls is None:
+                config = self.config
+                # The default profile reuses the app's Config instead of building another one
+                controls = {config.default_profile: TimeControl(config=config)}
+                for name in config.profile_names()[1:]:
+                    controls[name] = TimeControl(name)
+                self._time_controls = controls
+            return self._time_controls
+
+    @property
+    def time_control(self):
+        return self.time_controls[self.config.default_profile]
+
+    @property
+    def router_control(self):
+        return self.time_control.router
+
+    @property
+    def scheduler(self):
+        with self.lock:
+            if self._scheduler is None:
+                self._scheduler = EnforcementScheduler(list(self.time_controls.values()),
+                                                       max_sleep=self.config.config.get('scheduler_max_sleep', 600))
+            return self._scheduler
+
+    @property
+    def publisher(self):
+        """One publisher for every /events client: one view computation per change or tick, whatever the number of dashboards."""
+        with self.lock:
+            if self._publisher is None:
+                config = self.config
+                self._publisher = EventPublisher(self.compute_status, tick_interval=config.config.get('sse_tick', 15))
+                config.add_event_listener(
+                    lambda event: self._publisher.on_usage_event(event.get('profile') or config.default_profile, event))
+            return self._publisher
+
+    def wake(self, reason):
+        """Re-check enforcement now, if this process runs it."""
+        with self.lock:
+            scheduler = self._scheduler if self.started else None
+        if scheduler is not None:
+            scheduler.wake(reason)
+
+    def warm_up(self, timeout=None):
+        """Load the document and read the router state in parallel, before serving the first request.
+
+        A worker that isn't the leader only loads the document: the leader reads the router for everyone.
+        """
+        timeout = self.config.config.get('warmup_timeout', 10) if timeout is None else timeout
+        start = time.monotonic()
+        controls = self.time_controls
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='warmup')
+        futures = [pool.submit(self.router_control.refresh_firewall_status)] if is_leader() else []
+        futures += [pool.submit(control.config.get_profile_data) for control in controls.values()]
+        done, pending = wait(futures, timeout=timeout)
+        # A router that is slow to answer keeps warming up in the background, not in the way of requests
+        pool.shutdown(wait=False)
+        for future in done:
+            if future.exception() is not None:
+                logger.error(f"Error warming up: {str(future.exception())}")
+        logger.info(f"Warmed up {len(controls)} profiles in {time.monotonic() - start:.2f}s"
+                    + (f", {len(pending)} tasks still running" if pending else ''))
+
+    def start_background(self):
+        """Start enforcement: directly in a single process, or once elected leader among several workers."""
+        with self.lock:
+            if self.started or self.lease is not None:
+                return
+            config = self.config
+            if config.config.get('workers', 1) > 1:
+                # With several worker processes only the holder of the leader lease runs enforcement and changes the router
+                self.lease = LeaderLease(os.path.join(config.base_dir, 'kidcontrol.leader'),
+                                         on_acquire=self._start_threads, on_release=self._stop_threads,
+                                         retry=config.config.get('leader_retry', 5))
+                set_lease(self.lease)
+                lease = self.lease
+            else:
+                lease = None
+            atexit.register(self.shutdown)
+        if lease is not None:
+            # Every worker follows the others' changes: the leader to enforce them, all of them for /events
+            self.watch_stop.clear()
+            threading.Thread(target=self._watch_storage, daemon=True, name='storage-watch').start()
+            lease.start()
+        else:
+            self._start_threads()
+
+    def _start_threads(self):
+        with self.lock:
+            self.started = True
+        self.scheduler.start()
+        router_control = self.router_control
+        # Keep the router status cache warm so '/' never waits on SSH
+        router_control.start_status_refresher()
+        # Retry restrict changes that failed while the router was unreachable
+        router_control.start_reconciler()
+
+    def _watch_storage(self, interval=1.0):
+        """Pick up the changes of the other workers within interval seconds.
+
+        Their usage events reach this worker's /events clients; in the leader, enforcement
+        is re-checked right away.
+        """
+        while not self.watch_stop.wait(interval):
+            try:
+                if self.config.reload_changes() and self.started:
+                    self.wake('changed by another worker')
+                    self.router_control.wake_reconciler()
+            except Exception as e:
+                logger.error(f"Error watching storage: {str(e)}")
+
+    def _stop_threads(self):
+        with self.lock:
+            if not self.started:
+                return
+            self.started = False
+        self.scheduler.stop(timeout=5)
+        self.router_control.stop_status_refresher()
+        self.router_control.stop_reconciler()
+
+    def shutdown(self):
+        """Stop the background work and hand the leader lease to another worker."""
+        with self.lock:
+            publisher = self._publisher
+        self.watch_stop.set()
+        if publisher is not None:
+            publisher.stop()
+        if self.lease is not None:
+            self.lease.release()
+        else:
+            self._stop_threads()
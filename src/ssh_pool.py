@@ -0,0 +1,175 @@
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from config import setup_logger
+
+# Get logger
+logger = setup_logger('ROUTER.CONTROL')
+
+# Exit code of a command that ran out of time, as with coreutils timeout(1)
+TIMEOUT_EXIT = 124
+
+class CommandLatency:
+    """Thread-safe per-command latency counters and the number of connections opened to the router."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = {}
+        self.connects = 0
+
+    def connected(self):
+        with self.lock:
+            self.connects += 1
+
+    def record(self, label, seconds):
+        with self.lock:
+            entry = self.commands.setdefault(label, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            ms = seconds * 1000
+            entry['count'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+
+    def snapshot(self):
+        """Return {'connects': n, 'commands': {label: {count, total_ms, max_ms, avg_ms}}}."""
+        with self.lock:
+            commands = {
+                label: dict(entry, avg_ms=entry['total_ms'] / entry['count'])
+                for label, entry in self.commands.items()
+            }
+            return {'connects': self.connects, 'commands': commands}
+
+class SSHSessionPool:
+    """Long-lived, multiplexed SSH sessions to the router.
+
+    Each slot of the pool is an OpenSSH ControlMaster socket. The first command on a slot
+    pays for the TCP handshake and key exchange; every later command is multiplexed over
+    the already authenticated connection. Masters are kept alive with ServerAliveInterval
+    and are re-established automatically when the router drops them.
+    """
+    def __init__(self, host, user, password=None, pool_size=2, keepalive=15, persist=600, connect_timeout=5):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.pool_size = max(1, int(pool_size))
+        self.keepalive = int(keepalive)
+        self.persist = int(persist)
+        self.connect_timeout = int(connect_timeout)
+        self.control_dir = tempfile.mkdtemp(prefix='kidcontrol-ssh-')
+        self._slots = queue.Queue()
+        for slot in range(self.pool_size):
+            self._slots.put(slot)
+        self.latency_counters = CommandLatency()
+
+    def _control_path(self, slot):
+        return os.path.join(self.control_dir, f'{slot}.sock')
+
+    def _ssh_args(self, slot):
+        args = []
+        if self.password:
+            # sshpass -e reads the password from the environment instead of argv
+            args += ['sshpass', '-e']
+        args += [
+            'ssh',
+            '-o', 'StrictHostKeyChecking=no',
+            '-o', 'UserKnownHostsFile=/dev/null',
+            '-o', 'LogLevel=ERROR',
+            '-o', 'ControlMaster=auto',
+            '-o', f'ControlPath={self._control_path(slot)}',
+            '-o', f'ControlPersist={self.persist}',
+            '-o', f'ServerAliveInterval={self.keepalive}',
+            '-o', 'ServerAliveCountMax=3',
+            '-o', f'ConnectTimeout={self.connect_timeout}',
+            f'{self.user}@{self.host}',
+        ]
+        return args
+
+    def _env(self):
+        env = dict(os.environ)
+        if self.password:
+            env['SSHPASS'] = self.password
+        return env
+
+    def _exec(self, slot, command, timeout=None):
+        if not os.path.exists(self._control_path(slot)):
+            self.latency_counters.connected()
+        try:
+            return subprocess.run(self._ssh_args(slot) + [command], capture_output=True, text=True, env=self._env(),
+                                  timeout=timeout)
+        except subprocess.TimeoutExpired:
+            # The session may be wedged: drop it so the next command starts clean
+            self._reset(slot)
+            return subprocess.CompletedProcess(command, TIMEOUT_EXIT, '', f'timed out after {timeout}s\n')
+
+    def _reset(self, slot):
+        """Tear down a slot's master so the next command opens a fresh connection."""
+        path = self._control_path(slot)
+        try:
+            subprocess.run(self._ssh_args(slot)[:-1] + ['-O', 'exit', f'{self.user}@{self.host}'],
+                           capture_output=True, text=True, env=self._env(), timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def run(self, command, label=None, timeout=None, retry=False):
+        """Run a command on the router over a pooled session and return the CompletedProcess.
+
+        With a timeout, the whole call (waiting for a session, a reconnect and the retry
+        included) gives up after that many seconds with exit code TIMEOUT_EXIT. Only pass
+        retry=True for read-only commands: exit 255 doesn't tell whether the command
+        already ran before the link dropped, and running a change twice is not safe.
+        """
+        label = label or command.split()[0]
+        start = time.monotonic()
+        try:
+            slot = self._slots.get(timeout=timeout)
+        except queue.Empty:
+            self.latency_counters.record(label, time.monotonic() - start)
+            return subprocess.CompletedProcess(command, TIMEOUT_EXIT, '', f'no SSH session free within {timeout}s\n')
+        try:
+            result = self._exec(slot, command, self._remaining(start, timeout))
+            if result.returncode == 255:
+                # ssh itself failed (dead master, dropped link): drop the session so the next command reconnects
+                logger.info(f"SSH session {slot} to {self.host} lost, reconnecting: {result.stderr.strip()}")
+                self._reset(slot)
+                if retry:
+                    result = self._exec(slot, command, self._remaining(start, timeout))
+            self.latency_counters.record(label, time.monotonic() - start)
+            return result
+        finally:
+            self._slots.put(slot)
+
+    @staticmethod
+    def _remaining(start, timeout):
+        if timeout is None:
+            return None
+        return max(0.1, timeout - (time.monotonic() - start))
+
+    def latency_stats(self):
+        """Return per-command latency counters, plus how many connections were opened."""
+        return self.latency_counters.snapshot()
+
+    def close(self):
+        """Close every master connection and remove the control directory."""
+        for slot in range(self.pool_size):
+            if os.path.exists(self._control_path(slot)):
+                self._reset(slot)
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+
+_session_pools = {}
+_session_pools_lock = threading.Lock()
+
+def get_session_pool(host, user, password=None, **options):
+    """Return the shared session pool for a router, creating it on first use."""
+    key = (host, user)
+    with _session_pools_lock:
+        pool = _session_pools.get(key)
+        if pool is None:
+            pool = SSHSessionPool(host, user, password, **options)
+            _session_pools[key] = pool
+        return pool
@@ -0,0 +1,152 @@
+import json
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+
+# Top-level keys stored one row per entry by row-level backends; everything else is one value
+SECTIONS = ('settings', 'time_records', 'task_status', 'profiles')
+
+class JsonFileBackend:
+    """The whole document in one JSON file, replaced atomically on every save."""
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def signature(self):
+        """Return (mtime, size, inode) of the file, or None if it can't be read."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def load(self):
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def save(self, data, changes=None):
+        """Write to a temp file, fsync, rename. `changes` is ignored: the file is always rewritten."""
+        directory = os.path.dirname(self.path) or '.'
+        fd, tmp_path = tempfile.mkstemp(prefix='.data.', suffix='.tmp', dir=directory)
+        try:
+            # mkstemp creates the file 0600; keep the permissions data.json had
+            os.chmod(tmp_path, self._mode())
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        # Make the rename itself durable
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _mode(self):
+        """Return the mode of the current file, or what open() would give a new one."""
+        try:
+            return stat.S_IMODE(os.stat(self.path).st_mode)
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            return 0o666 & ~umask
+
+class SqliteBackend:
+    """The document as (section, key) rows in SQLite with WAL journaling.
+
+    Readers never block the writer and vice versa; writers are serialized by
+    BEGIN IMMEDIATE. save() with a set of changed (section, key) pairs only touches
+    those rows. Every save bumps a version counter that serves as the signature.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS document ('
+                          'section TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                          'PRIMARY KEY (section, key))')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    def exists(self):
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM document LIMIT 1').fetchone() is not None
+
+    def signature(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        return row[0] if row else None
+
+    def load(self):
+        data = {}
+        with self.lock:
+            rows = self.conn.execute('SELECT section, key, value FROM document').fetchall()
+        for section, key, value in rows:
+            if section:
+                data.setdefault(section, {})[key] = json.loads(value)
+            else:
+                data[key] = json.loads(value)
+        for section in SECTIONS:
+            data.setdefault(section, {})
+        return data
+
+    @staticmethod
+    def _rows(data):
+        for key, value in data.items():
+            if key in SECTIONS and isinstance(value, dict):
+                for sub_key, sub_value in value.items():
+                    yield key, sub_key, json.dumps(sub_value)
+            else:
+                yield '', key, json.dumps(value)
+
+    def save(self, data, changes=None):
+        """Write the changed rows (or the whole document if changes is None) in one transaction."""
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                if changes is None:
+                    self.conn.execute('DELETE FROM document')
+                    self.conn.executemany('INSERT INTO document (section, key, value) VALUES (?, ?, ?)',
+                                          list(self._rows(data)))
+                else:
+                    for section, key in changes:
+                        if section:
+                            present = key in data.get(section, {})
+                            value = data.get(section, {}).get(key)
+                        else:
+                            present = key in data
+                            value = data.get(key)
+                        if not present:
+                            self.conn.execute('DELETE FROM document WHERE section = ? AND key = ?', (section, key))
+                        elif not section and key in SECTIONS:
+                            # A whole section was replaced
+                            self.conn.execute('DELETE FROM document WHERE section = ?', (key,))
+                            self.conn.executemany('INSERT INTO document (section, key, value) VALUES (?, ?, ?)',
+                                                  list(self._rows({key: value})))
+                        else:
+                            self.conn.execute('INSERT OR REPLACE INTO document (section, key, value) VALUES (?, ?, ?)',
+                                              (section, key, json.dumps(value)))
+                self.conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('version', 0)")
+                self.conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'version'")
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+def create_backend(kind, base_dir):
+    """Return the storage backend for a 'json' or 'sqlite' storage setting."""
+    if kind == 'sqlite':
+        return SqliteBackend(os.path.join(base_dir, 'data.db'))
+    return JsonFileBackend(os.path.join(base_dir, 'data.json'))
@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+from log_pipeline import setup_logger
+
+# Get logger
+logger = setup_logger('TIME.CONTROL')
+
+class UsageJournal:
+    """Append-only, line-delimited log of usage events.
+
+    Every event gets a monotonically increasing 'seq'. data.json records the seq of the
+    last event folded into it ('journal_seq'); on load, the events after that checkpoint
+    are replayed on top of the document. compact() moves the already checkpointed events
+    to an archive file, which is kept as an audit trail.
+    """
+    def __init__(self, path, archive_path=None):
+        self.path = path
+        self.archive_path = archive_path or path.replace('.log', '.archive.log')
+        self.lock = threading.Lock()
+        self.last_seq = 0
+        # Lines in the journal file, valid while its signature is counted_signature
+        self.lines = 0
+        self.counted_signature = None
+        for event in self.read():
+            self.last_seq = max(self.last_seq, event.get('seq', 0))
+
+    def read(self):
+        """Yield every readable event in the journal, skipping a torn last line."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.error(f"Skipping unreadable journal line: {line[:80]}")
+
+    def signature(self):
+        """Return (mtime, size, inode) of the journal file, or None if there is none."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def size(self):
+        """Return how many events the journal file holds, recounting only if another process changed it."""
+        with self.lock:
+            signature = self.signature()
+            if signature != self.counted_signature:
+                self.lines = self._count_lines()
+                self.counted_signature = signature
+            return self.lines
+
+    def _count_lines(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return sum(1 for line in f if line.strip())
+        except FileNotFoundError:
+            return 0
+
+    def replay(self, after_seq):
+        """Return the events recorded after a checkpoint, in order."""
+        return [event for event in self.read() if event.get('seq', 0) > after_seq]
+
+    def seed(self, seq):
+        """Make sure new events are numbered after a checkpoint loaded from data.json."""
+        with self.lock:
+            self.last_seq = max(self.last_seq, seq)
+
+    def new_event(self, event_type, **fields):
+        """Build an event with the next seq number, without writing it."""
+        with self.lock:
+            self.last_seq += 1
+            return dict(fields, seq=self.last_seq, type=event_type, ts=fields.get('ts', int(time.time())))
+
+    def append(self, events):
+        """Durably append events: one write and one fsync, whatever the size of the history."""
+        if not events:
+            return
+        payload = ''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in events)
+        with self.lock:
+            counted = self.signature() == self.counted_signature
+            with open(self.path, 'a') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            if counted:
+                # Nobody else wrote since the last count: keep it without reading the file again
+                self.lines += len(events)
+                self.counted_signature = self.signature()
+
+    def compact(self, checkpoint_seq):
+        """Move events up to checkpoint_seq to the archive and keep only the tail in the journal."""
+        with self.lock:
+            events = list(self.read())
+            done = [event for event in events if event.get('seq', 0) <= checkpoint_seq]
+            if not done:
+                return 0
+            tail = [event for event in events if event.get('seq', 0) > checkpoint_seq]
+            with open(self.archive_path, 'a') as f:
+                f.write(''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in done))
+                f.flush()
+                os.fsync(f.fileno())
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in tail))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.lines = len(tail)
+            self.counted_signature = self.signature()
+            return len(done)
+
+def apply_event(data, event):
+    """Fold one usage event into the document, exactly as the live code path would.
+
+    Returns the set of (section, key) pairs it changed, for row-level storage backends.
+    Events of a non-default profile carry 'profile' and change that profile's row.
+    """
+    profile = event.get('profile')
+    if profile:
+        changes = _apply_to_profile(data['profiles'][profile], event)
+        return {('profiles', profile)} if changes else set()
+    return _apply_to_profile(data, event)
+
+def _apply_to_profile(data, event):
+    settings = data.setdefault('settings', {})
+    records = data.setdefault('time_records', {})
+    event_type = event.get('type')
+    if event_type == 'start':
+        changes = {('time_records', 'start_time'), ('time_records', 'stop_time')}
+        if 'rest_time' in event:
+            records['rest_time'] = str(event['rest_time'])
+            changes.add(('time_records', 'rest_time'))
+        records['start_time'] = str(event['ts'])
+        records.pop('stop_time', None)
+        return changes
+    if event_type == 'stop':
+        minutes = int(event.get('minutes', 0))
+        records['elapsed_time'] = str(int(records.get('elapsed_time', 0) or 0) + minutes)
+        settings['current'] = int(settings.get('current', 0) or 0) + minutes
+        if event.get('reason', 'manual') != 'manual':
+            records['force_stops'] = str(int(records.get('force_stops', 0) or 0) + 1)
+        records['stop_time'] = str(event['ts'])
+        records.pop('start_time', None)
+        return {('time_records', 'elapsed_time'), ('settings', 'current'), ('time_records', 'force_stops'),
+                ('time_records', 'stop_time'), ('time_records', 'start_time')}
+    if event_type == 'adjust':
+        settings['current'] = int(settings.get('current', 0) or 0) + int(event.get('minutes', 0))
+        changes = {('settings', 'current')}
+        task = event.get('task')
+        if task:
+            day = event.get('day', '')
+            data.setdefault('task_status', {}).setdefault(day, {})[task] = True
+            changes.add(('task_status', day))
+        return changes
+    return set()
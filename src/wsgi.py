@@ -0,0 +1,6 @@
+"""WSGI entry point for running the app under a production server (see gunicorn.conf.py)."""
+from app import create_app
+
+# Warmed up, with enforcement started (or the leader election joined) before the first request
+app = create_app()
+application = app